@@ -0,0 +1,310 @@
+# bench.py
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the ingest pipeline.
+
+  python bench.py vectors --n 50000          # per-point lists vs columnar ndarray upsert path
+  python bench.py startup                    # import time of embedding_models and model load times
+  python bench.py backends --threads 8       # torch vs ONNX fp32 vs ONNX int8: throughput + parity
+  python bench.py querycache                 # embed + search latency with and without the query caches
+  python bench.py profiles                   # recall@k, latency and Qdrant RSS of each collection profile
+"""
+import argparse
+import re
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, Tuple
+
+import numpy as np
+from qdrant_client import QdrantClient
+
+from pathlib import Path
+import utils
+from vector_store import VectorStore
+
+def measure(fn: Callable[[], object]) -> Tuple[float, float]:
+    """Run fn twice: once timed, once under tracemalloc; return (seconds, peak traced MiB)."""
+    t0 = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - t0
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 2**20
+
+def print_table(title: str, rows: Dict[str, Tuple[float, ...]], headers: Tuple[str, ...]) -> None:
+    print(f"\n{title}")
+    print(f"{'':<22}" + "".join(f"{h:>14}" for h in headers))
+    for name, vals in rows.items():
+        print(f"{name:<22}" + "".join(f"{v:>14.2f}" for v in vals))
+
+# ------------------ vectors ------------------
+def bench_vectors(args) -> None:
+    rng = np.random.default_rng(0)
+    emb = rng.standard_normal((args.n, args.dim)).astype(np.float32)
+    ids = list(range(args.n))
+    payloads = [{"doc_id": f"DOC_{i % 100:03d}", "chunk_id": f"CHUNK_{i:06d}"} for i in ids]
+
+    client = QdrantClient(args.qdrant_url) if args.qdrant_url else None
+    vs = VectorStore(client=client) if client else None
+    if vs:
+        vs.create_or_recreate_collection("bench_vectors", (args.dim, "cosine"), force=True)
+
+    def per_point():
+        # What ingest.py used to do: one Python list per vector, one PointStruct per point
+        vecs = [emb[i].tolist() for i in range(len(emb))]
+        if vs:
+            vs.upsert_points("bench_vectors", ids, vecs, payloads, batch_size=args.batch_size)
+        else:
+            for batch in VectorStore._point_batches(ids, vecs, payloads, args.batch_size):
+                pass
+
+    def columnar():
+        if vs:
+            vs.upsert_points("bench_vectors", ids, emb, payloads, batch_size=args.batch_size)
+        else:
+            for batch in VectorStore._array_batches(ids, emb, payloads, args.batch_size):
+                batch.to_batch()
+
+    rows = {
+        "per-point lists": measure(per_point),
+        "columnar ndarray": measure(columnar),
+    }
+    if vs:
+        vs.client.delete_collection("bench_vectors")
+    where = f"upsert to {args.qdrant_url}" if args.qdrant_url else "point construction only"
+    print_table(f"{args.n} x {args.dim} float32 vectors, batch {args.batch_size} ({where})",
+                rows, ("seconds", "peak MiB"))
+
+# ------------------ startup ------------------
+def bench_startup(args) -> None:
+    # Import time is measured in a fresh interpreter so nothing is already cached in sys.modules
+    code = "import time; t = time.perf_counter(); import embedding_models; print(time.perf_counter() - t)"
+    runs = [
+        float(subprocess.run(
+            [sys.executable, "-c", code], cwd=Path(__file__).parent,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip().splitlines()[-1])
+        for _ in range(args.repeat)
+    ]
+    rows = {"import embedding_models": (min(runs) * 1000,)}
+
+    import embedding_models as em
+    for name, kwargs in (("warmup text encoder", {"text": True, "image": False}),
+                         ("warmup image encoder", {"text": False, "image": True})):
+        t0 = time.perf_counter()
+        try:
+            em.warmup(**kwargs)
+            rows[name] = ((time.perf_counter() - t0) * 1000,)
+        except Exception as e:
+            print(f"{name} failed: {e}")
+    print_table(f"Startup (best of {args.repeat} imports)", rows, ("ms",))
+
+# ------------------ backends ------------------
+def bench_backends(args) -> None:
+    import embedding_models as em
+
+    root = utils.find_liacara_root()
+    texts = [r.get("text") or "" for _, r in zip(range(args.n_texts), utils.read_jsonl_from_articles_root(
+        root / "Rag_Vault" / "articles"))]
+    if not texts:
+        texts = [f"Synthetic cave art passage number {i} about pigments and dating." * 8 for i in range(args.n_texts)]
+    images = utils.list_images(args.images or str(root / "Media_Vault" / "images"))[:args.n_images]
+    print(f"{len(texts)} texts, {len(images)} images, tolerance cos >= {args.tolerance}")
+
+    rows: Dict[str, Tuple[float, ...]] = {}
+    within: Dict[str, float] = {}
+    for backend in em.BACKENDS:
+        em.set_backend(backend, threads=args.threads)
+        em.embed_texts(texts[:8]) # Load/export outside the timed region
+        if images:
+            em.embed_images(images[:1])
+        t0 = time.perf_counter()
+        em.embed_texts(texts)
+        text_rate = len(texts) / (time.perf_counter() - t0)
+        img_rate = float("nan")
+        if images:
+            t0 = time.perf_counter()
+            em.embed_images(images)
+            img_rate = len(images) / (time.perf_counter() - t0)
+
+        cos_t = cos_i = 1.0
+        if backend != "torch":
+            report = em.check_parity(backend, texts, images or None)
+            cos_t = report["text"]["min"]
+            cos_i = report.get("image", {}).get("min", float("nan"))
+        rows[backend] = (text_rate, img_rate, cos_t, cos_i)
+        if cos_t >= args.tolerance and (not images or cos_i >= args.tolerance):
+            within[backend] = text_rate
+    em.set_backend("torch")
+
+    print_table(f"Encoder backends (intra-op threads: {args.threads or 'auto'})", rows,
+                ("texts/s", "images/s", "min cos txt", "min cos img"))
+    if within:
+        print(f"\nFastest text backend within tolerance: {max(within, key=within.get)}")
+
+# ------------------ querycache ------------------
+def bench_querycache(args) -> None:
+    import embedding_models as em
+    from query_cache import ResultCache, text_query_encoder
+
+    rng = np.random.default_rng(0)
+    client = QdrantClient(args.qdrant_url) if args.qdrant_url else QdrantClient(":memory:")
+    vs = VectorStore(client=client)
+    vs.create_or_recreate_collection("bench_queries", (em.TEXT_DIM, "cosine"), force=True)
+    points = rng.standard_normal((args.n_points, em.TEXT_DIM)).astype(np.float32)
+    vs.upsert_points("bench_queries", list(range(args.n_points)), points)
+
+    # Popular questions repeat: draw query ids from a Zipf distribution
+    questions = [f"Where are the claviform signs of cave {i} and how old are they?" for i in range(args.n_distinct)]
+    stream = [questions[(z - 1) % args.n_distinct] for z in rng.zipf(1.3, args.n_queries)]
+
+    def run(embed, store) -> np.ndarray:
+        lat = []
+        for q in stream:
+            t0 = time.perf_counter()
+            store.search("bench_queries", embed(q).tolist(), limit=10)
+            lat.append(time.perf_counter() - t0)
+        return np.array(lat) * 1000
+
+    encoder = text_query_encoder()
+    cached_vs = VectorStore(client=client, result_cache=ResultCache())
+    em.embed_texts(["warmup"])
+    rows = {}
+    for name, embed, store in (("uncached", lambda q: em.embed_texts([q])[0], vs),
+                               ("query + result cache", encoder, cached_vs)):
+        lat = run(embed, store)
+        rows[name] = (np.percentile(lat, 50), np.percentile(lat, 99), lat.mean())
+    client.delete_collection("bench_queries")
+    print_table(f"{args.n_queries} queries over {args.n_distinct} distinct questions, {args.n_points} points",
+                rows, ("p50 ms", "p99 ms", "mean ms"))
+    print(f"Query embeddings: {encoder.cache.stats()}")
+    print(f"Search results:   {cached_vs.result_cache.stats()}")
+
+# ------------------ profiles ------------------
+def qdrant_rss_bytes(qdrant_url: str) -> float:
+    """Resident memory of the Qdrant process, from its Prometheus /metrics endpoint."""
+    import urllib.request
+    with urllib.request.urlopen(f"{qdrant_url.rstrip('/')}/metrics", timeout=10) as resp:
+        text = resp.read().decode("utf-8")
+    for metric in ("memory_resident_bytes", "process_resident_memory_bytes"):
+        m = re.search(rf"^{metric}(?:{{[^}}]*}})?\s+([0-9.eE+]+)$", text, re.MULTILINE)
+        if m:
+            return float(m.group(1))
+    return float("nan")
+
+def profile_dataset(args, client: QdrantClient) -> np.ndarray:
+    """Unit vectors to index: scrolled from --source-collection or synthetic clusters."""
+    if args.source_collection:
+        vecs, offset = [], None
+        while len(vecs) < args.n_points + args.n_queries:
+            points, offset = client.scroll(args.source_collection, limit=1024, offset=offset,
+                                           with_payload=False, with_vectors=[args.using or ""])
+            vecs.extend(p.vector[args.using] if isinstance(p.vector, dict) else p.vector for p in points)
+            if offset is None:
+                break
+        data = np.asarray(vecs, dtype=np.float32)
+    else:
+        # Clustered like real embeddings, unlike isotropic noise which makes every ANN index look bad
+        rng = np.random.default_rng(0)
+        n = args.n_points + args.n_queries
+        centers = rng.standard_normal((args.n_clusters, args.dim)).astype(np.float32)
+        data = centers[rng.integers(0, args.n_clusters, n)] + 0.35 * rng.standard_normal((n, args.dim)).astype(np.float32)
+    return data / np.linalg.norm(data, axis=1, keepdims=True)
+
+def bench_profiles(args) -> None:
+    from collection_profiles import PROFILES, get_profile
+
+    client = QdrantClient(args.qdrant_url, timeout=120)
+    vs = VectorStore(client=client)
+    data = profile_dataset(args, client)
+    queries, points = data[:args.n_queries], data[args.n_queries:]
+    # Exact cosine top-k as ground truth
+    truth = np.argsort(-(queries @ points.T), axis=1)[:, :args.k]
+    print(f"{len(points)} points x {points.shape[1]} dims, {len(queries)} held-out queries, k={args.k}")
+
+    rows = {}
+    for name in args.profiles or list(PROFILES):
+        profile = get_profile(name)
+        collection = f"bench_profile_{name.replace('-', '_')}"
+        rss0 = qdrant_rss_bytes(args.qdrant_url)
+        t0 = time.perf_counter()
+        vs.create_or_recreate_collection(collection, (points.shape[1], "cosine"), force=True, **profile.create_kwargs())
+        vs.upsert_points(collection, list(range(len(points))), points, batch_size=512)
+        vs.wait_for_green(collection, timeout=600, poll_interval=0.5)
+        build = time.perf_counter() - t0
+        rss = (qdrant_rss_bytes(args.qdrant_url) - rss0) / 2**20
+
+        if profile.search_params is not None:
+            vs.search_params[collection] = profile.search_params
+        lat, hits = [], 0
+        for q, expected in zip(queries, truth):
+            t1 = time.perf_counter()
+            res = vs.search(collection, q, limit=args.k, with_payload=False)
+            lat.append(time.perf_counter() - t1)
+            hits += len({p.id for p in res} & set(expected.tolist()))
+        lat = np.array(lat) * 1000
+        rows[name] = (hits / truth.size, np.percentile(lat, 50), np.percentile(lat, 99), rss, build)
+        if not args.keep:
+            client.delete_collection(collection)
+
+    print_table(f"Collection profiles on {args.qdrant_url}", rows,
+                (f"recall@{args.k}", "p50 ms", "p99 ms", "RSS +MiB", "build s"))
+    print("RSS is the growth of the whole Qdrant process; run against an otherwise idle server.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest pipeline micro-benchmarks.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("vectors", help="Compare per-point list conversion with the ndarray upsert path")
+    p.add_argument("--n", type=int, default=50_000, help="Number of vectors (default: 50000)")
+    p.add_argument("--dim", type=int, default=384, help="Vector dimension (default: 384)")
+    p.add_argument("--batch-size", type=int, default=256, help="Upsert batch size (default: 256)")
+    p.add_argument("--qdrant-url", type=str, default=None,
+                   help="Also upsert into a throwaway collection on this Qdrant (e.g. http://localhost:6333)")
+    p.set_defaults(func=bench_vectors)
+
+    p = sub.add_parser("startup", help="Time importing embedding_models and loading each encoder")
+    p.add_argument("--repeat", type=int, default=3, help="Fresh-interpreter imports to time (default: 3)")
+    p.set_defaults(func=bench_startup)
+
+    p = sub.add_parser("backends", help="Throughput and fp32-parity of each encoder backend")
+    p.add_argument("--n-texts", type=int, default=512, help="Chunk texts to encode (default: 512)")
+    p.add_argument("--n-images", type=int, default=64, help="Images to encode (default: 64)")
+    p.add_argument("--images", type=str, default=None, help="Image folder (default: Media_Vault/images)")
+    p.add_argument("--threads", type=int, default=0, help="ONNX Runtime intra-op threads (default: auto)")
+    p.add_argument("--tolerance", type=float, default=0.99,
+                   help="Minimum cosine with the fp32 vectors for a backend to qualify (default: 0.99)")
+    p.set_defaults(func=bench_backends)
+
+    p = sub.add_parser("querycache", help="Latency of repeated queries with the query/result caches")
+    p.add_argument("--n-points", type=int, default=20_000, help="Points in the throwaway collection (default: 20000)")
+    p.add_argument("--n-queries", type=int, default=2_000, help="Queries to run (default: 2000)")
+    p.add_argument("--n-distinct", type=int, default=200, help="Distinct questions (default: 200)")
+    p.add_argument("--qdrant-url", type=str, default=None,
+                   help="Qdrant to use instead of the in-process local mode (e.g. http://localhost:6333)")
+    p.set_defaults(func=bench_querycache)
+
+    p = sub.add_parser("profiles", help="Recall, latency and memory of each collection profile on a local Qdrant")
+    p.add_argument("--qdrant-url", type=str, default="http://localhost:6333",
+                   help="Qdrant server to benchmark (default: http://localhost:6333)")
+    p.add_argument("--profiles", type=str, nargs="+", default=None, help="Profiles to compare (default: all)")
+    p.add_argument("--n-points", type=int, default=100_000, help="Vectors to index (default: 100000)")
+    p.add_argument("--n-queries", type=int, default=500, help="Held-out query vectors (default: 500)")
+    p.add_argument("--dim", type=int, default=384, help="Dimension of synthetic vectors (default: 384)")
+    p.add_argument("--n-clusters", type=int, default=200, help="Clusters in the synthetic data (default: 200)")
+    p.add_argument("--k", type=int, default=10, help="Neighbours per query for recall@k (default: 10)")
+    p.add_argument("--source-collection", type=str, default=None,
+                   help="Use vectors scrolled from this collection (e.g. rag_text_chunks) instead of synthetic ones")
+    p.add_argument("--using", type=str, default=None, help="Named vector of --source-collection (e.g. image)")
+    p.add_argument("--keep", action="store_true", help="Keep the benchmark collections afterwards")
+    p.set_defaults(func=bench_profiles)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
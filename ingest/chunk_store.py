@@ -0,0 +1,182 @@
+# chunk_store.py
+"""
+Columnar chunk store: one Parquet (or uncompressed Arrow IPC) file per document.
+
+Repeated per-document metadata columns are dictionary-encoded, so a document's
+site_ids/license/paths/checksum cost one dictionary entry instead of one copy per
+chunk. Reads go through pyarrow.dataset, with memory mapping, column projection and
+doc_id predicate pushdown; files are also pruned by name before anything is opened.
+Chunks may carry a precomputed "embedding" column (float32 fixed-size list) tagged
+with the "embedding_model" that produced it. Requires pyarrow.
+"""
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+DICT_COLUMNS = ("doc_id", "license", "source_path", "registry_path", "checksum_sha256", "embedding_model")
+HEADER_KEY = b"liacara.chunks_header"
+
+def default_store_dir(liacara_root: Path) -> Path:
+    """Shared store location used by chunker.py and ingest.py."""
+    return Path(liacara_root) / "Rag_Vault" / "chunk_store"
+
+def store_path(store_dir: Path, doc_id: str, fmt: str = "parquet") -> Path:
+    return Path(store_dir) / f"{doc_id}_chunks{FORMATS[fmt]}"
+
+def _fmt_of(path: Path) -> str:
+    return "arrow" if path.suffix == FORMATS["arrow"] else "parquet"
+
+def to_table(
+    records: List[Dict[str, Any]],
+    embeddings: Optional[np.ndarray] = None,
+    embedding_model: Optional[str] = None,
+):
+    """Build an Arrow table from chunk records, dictionary-encoding metadata columns."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    table = pa.Table.from_pylist(records)
+    if embeddings is not None:
+        emb = np.ascontiguousarray(embeddings, dtype=np.float32)
+        values = pa.array(emb.reshape(-1), type=pa.float32())
+        table = table.append_column("embedding", pa.FixedSizeListArray.from_arrays(values, emb.shape[1]))
+        table = table.append_column("embedding_model", pa.array([embedding_model] * len(records), pa.string()))
+    for name in DICT_COLUMNS:
+        idx = table.schema.get_field_index(name)
+        if idx >= 0 and not pa.types.is_dictionary(table.schema.field(idx).type):
+            col = table.column(idx)
+            if pa.types.is_null(col.type):
+                col = col.cast(pa.string())
+            table = table.set_column(idx, name, pc.dictionary_encode(col))
+    return table
+
+def write_chunks(
+    path: Path,
+    records: List[Dict[str, Any]],
+    header: Dict[str, Any],
+    embeddings: Optional[np.ndarray] = None,
+    embedding_model: Optional[str] = None,
+) -> int:
+    """Write one document's chunks atomically; header goes into the schema metadata."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    table = to_table(records, embeddings, embedding_model)
+    table = table.replace_schema_metadata({HEADER_KEY: json.dumps(header).encode("utf-8")})
+    tmp = path.with_name(f".{path.name}.tmp")
+    try:
+        if _fmt_of(path) == "arrow":
+            # Uncompressed IPC so memory-mapped reads are zero-copy
+            with pa.OSFile(str(tmp), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        else:
+            pq.write_table(table, str(tmp), compression="zstd", use_dictionary=True)
+        tmp.replace(path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    return table.num_rows
+
+def read_header(path: Path) -> Optional[Dict[str, Any]]:
+    """Header stored by write_chunks, read from the file footer/schema only."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    path = Path(path)
+    if not path.exists():
+        return None
+    try:
+        if _fmt_of(path) == "arrow":
+            with pa.memory_map(str(path)) as source:
+                schema = pa.ipc.open_file(source).schema
+        else:
+            schema = pq.read_schema(str(path))
+        raw = (schema.metadata or {}).get(HEADER_KEY)
+        return json.loads(raw) if raw else None
+    except (OSError, ValueError, pa.ArrowInvalid):
+        return None
+
+def store_files(store_dir: Path, doc_ids: Optional[Sequence[str]] = None, fmt: str = "parquet") -> List[Path]:
+    """Chunk files in store_dir, pruned by name to doc_ids when given."""
+    store_dir = Path(store_dir)
+    if doc_ids is not None:
+        return [p for p in (store_path(store_dir, d, fmt) for d in sorted(set(doc_ids))) if p.exists()]
+    return sorted(store_dir.glob(f"*_chunks{FORMATS[fmt]}"))
+
+def open_dataset(files: List[Path], memory_map: bool = True):
+    """pyarrow Dataset over the given chunk files, with their schemas unified."""
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    from pyarrow import fs
+
+    if not files:
+        return None
+    fmt = "ipc" if _fmt_of(files[0]) == "arrow" else "parquet"
+    filesystem = fs.LocalFileSystem(use_mmap=memory_map)
+    paths = [str(Path(f).resolve()) for f in files]
+    # Documents chunked with different methods/options may have different columns
+    schemas = [ds.dataset(p, format=fmt, filesystem=filesystem).schema.remove_metadata() for p in paths]
+    return ds.dataset(paths, format=fmt, filesystem=filesystem, schema=pa.unify_schemas(schemas))
+
+def iter_chunk_batches(
+    store_dir: Path,
+    columns: Optional[List[str]] = None,
+    doc_ids: Optional[Sequence[str]] = None,
+    fmt: str = "parquet",
+    memory_map: bool = True,
+    batch_size: int = 4096,
+    exclude: Sequence[str] = (),
+):
+    """Scan record batches with column projection and doc_id pushdown."""
+    import pyarrow.dataset as ds
+
+    dataset = open_dataset(store_files(store_dir, doc_ids, fmt), memory_map)
+    if dataset is None:
+        return
+    columns = [c for c in (columns or dataset.schema.names) if c in dataset.schema.names and c not in exclude]
+    flt = ds.field("doc_id").isin(list(doc_ids)) if doc_ids is not None else None
+    yield from dataset.to_batches(columns=columns, filter=flt, batch_size=batch_size)
+
+def read_chunks(
+    store_dir: Path,
+    columns: Optional[List[str]] = None,
+    doc_ids: Optional[Sequence[str]] = None,
+    fmt: str = "parquet",
+    memory_map: bool = True,
+):
+    """Whole (projected, filtered) store as one Arrow table."""
+    import pyarrow as pa
+
+    batches = list(iter_chunk_batches(store_dir, columns, doc_ids, fmt, memory_map))
+    return pa.Table.from_batches(batches) if batches else None
+
+def iter_chunk_rows(
+    store_dir: Path,
+    doc_ids: Optional[Sequence[str]] = None,
+    fmt: str = "parquet",
+    memory_map: bool = True,
+    with_embeddings: bool = True,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield chunk records as dicts (the JSONL record shape). When with_embeddings, rows
+    carry "embedding" as a float32 ndarray view plus "embedding_model"; otherwise those
+    columns are not read at all.
+    """
+    exclude = () if with_embeddings else ("embedding", "embedding_model")
+    for batch in iter_chunk_batches(store_dir, None, doc_ids, fmt, memory_map, exclude=exclude):
+        names = [n for n in batch.schema.names if n not in ("embedding", "embedding_model")]
+        rows = batch.select(names).to_pylist()
+        col = batch.column("embedding") if "embedding" in batch.schema.names else None
+        # A batch comes from one file, so its embeddings are all present or all null
+        if col is not None and len(col) and col.null_count == 0:
+            vecs = col.flatten().to_numpy(zero_copy_only=False).reshape(len(col), -1)
+            models = batch.column("embedding_model").to_pylist()
+            for i, row in enumerate(rows):
+                row["embedding"] = vecs[i]
+                row["embedding_model"] = models[i]
+        yield from rows
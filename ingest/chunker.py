@@ -5,17 +5,112 @@ Chunk markdown files from Rag_Vault/articles/DOC_paper_* directories.
 """
 import argparse
 import json
+import os
+import re
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import Dict, Iterator, List, Optional, Any, Tuple, Union
 from langchain_text_splitters import (
     RecursiveCharacterTextSplitter,
     MarkdownTextSplitter,
 )
 from langchain_experimental.text_splitter import SemanticChunker
 from langchain_openai import OpenAIEmbeddings
+from langchain_core.embeddings import Embeddings
+import numpy as np
 
 # Import from our new utility module
 import utils
+import embedding_models as em
+import chunk_store
+from structure_splitter import MarkdownStructureSplitter, load_toc_pages
+from embedding_cache import EmbeddingCache, cached_embed, content_sha256, default_cache_path
+
+class CachedEmbeddings(Embeddings):
+    """Wraps a LangChain Embeddings so sentence vectors are served from the persistent cache."""
+
+    VERSION = "raw-v1"
+
+    def __init__(self, inner: Embeddings, cache: EmbeddingCache, model_name: Optional[str] = None):
+        self.inner = inner
+        self.cache = cache
+        self.model_name = model_name or getattr(inner, "model", None) or type(inner).__name__
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        hashes = [content_sha256(t) for t in texts]
+
+        def compute(idx: List[int]) -> np.ndarray:
+            return np.asarray(self.inner.embed_documents([texts[i] for i in idx]), dtype=np.float32)
+
+        return cached_embed(self.cache, self.model_name, self.VERSION, hashes, compute).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+class LocalSemanticSplitter:
+    """
+    SemanticChunker's percentile-breakpoint algorithm on the local MiniLM encoder.
+
+    Sentences are windowed with their buffer_size neighbours, the windows of many
+    documents are embedded in one embed_texts call (token-budget batches, embedding
+    cache), and a document is split wherever the cosine distance between consecutive
+    windows exceeds the breakpoint_percentile of its distances.
+    """
+
+    SENTENCE_SPLIT = re.compile(r"(?<=[.?!])\s+")
+
+    def __init__(
+        self,
+        cache: Optional[EmbeddingCache] = None,
+        buffer_size: int = 1,
+        breakpoint_percentile: float = 95.0,
+    ):
+        self.cache = cache
+        self.buffer_size = buffer_size
+        self.breakpoint_percentile = breakpoint_percentile
+
+    def sentence_windows(self, text: str) -> Tuple[List[str], List[str]]:
+        """Return (sentences, windows) where windows[i] joins sentence i with its neighbours."""
+        sentences = [s for s in self.SENTENCE_SPLIT.split(text) if s.strip()]
+        b = self.buffer_size
+        windows = [" ".join(sentences[max(0, i - b):i + b + 1]) for i in range(len(sentences))]
+        return sentences, windows
+
+    def breakpoints(self, vectors: np.ndarray) -> np.ndarray:
+        """Indices i after which to split, given L2-normalised window vectors."""
+        if len(vectors) < 2:
+            return np.empty(0, dtype=np.int64)
+        distances = 1.0 - np.einsum("ij,ij->i", vectors[:-1], vectors[1:])
+        threshold = np.percentile(distances, self.breakpoint_percentile)
+        return np.flatnonzero(distances > threshold)
+
+    def split_texts(self, texts: List[str]) -> List[List[str]]:
+        """Split several documents, embedding all their sentence windows together."""
+        per_doc = [self.sentence_windows(t) for t in texts]
+        all_windows = [w for _, windows in per_doc for w in windows]
+        vectors = em.embed_texts(all_windows, cache=self.cache) if all_windows else None
+
+        out: List[List[str]] = []
+        start = 0
+        for sentences, windows in per_doc:
+            doc_vectors = vectors[start:start + len(windows)] if windows else None
+            start += len(windows)
+            if len(sentences) < 2:
+                out.append(sentences)
+                continue
+            cuts = self.breakpoints(doc_vectors) + 1
+            bounds = [0, *cuts.tolist(), len(sentences)]
+            out.append([" ".join(sentences[a:b]) for a, b in zip(bounds[:-1], bounds[1:]) if b > a])
+        return out
+
+    def split_text(self, text: str) -> List[str]:
+        return self.split_texts([text])[0]
+
+# Bump when the chunk record layout changes, so existing outputs are rewritten
+CHUNKS_FORMAT_VERSION = 1
 
 class DocumentChunker:
     """Chunk markdown files with metadata from registry CSV."""
@@ -40,11 +135,27 @@ class DocumentChunker:
         """Get the articles root path relative to LIACARA root."""
         return cls.get_liacara_root() / "Rag_Vault" / "articles"
     
-    def __init__(self, method: str = "recursive", chunk_size: int = 1000, chunk_overlap: int = 200, embeddings=None):
+    def __init__(
+        self,
+        method: str = "recursive",
+        chunk_size: int = 1000,
+        chunk_overlap: int = 200,
+        embeddings=None,
+        embedding_cache: Optional[EmbeddingCache] = None,
+        semantic_embeddings: str = "openai",
+        output_format: str = "jsonl",
+        store_embeddings: bool = False,
+    ):
         self.method = method.lower()
+        self.semantic_embeddings = semantic_embeddings
+        self.output_format = output_format
+        # Only the columnar formats have somewhere to keep the vectors
+        self.store_embeddings = store_embeddings and output_format != "jsonl"
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
         self.embeddings = embeddings
+        self._default_embeddings = embeddings is None
+        self.embedding_cache = embedding_cache
         self.registry_data = utils.load_document_registry(self.get_registry_path())
         self.splitter = self._create_splitter()
         
@@ -61,6 +172,13 @@ class DocumentChunker:
                 chunk_size=self.chunk_size,
                 chunk_overlap=self.chunk_overlap
             )
+        elif self.method == "structure":
+            return MarkdownStructureSplitter(
+                chunk_size=self.chunk_size,
+                chunk_overlap=self.chunk_overlap,
+            )
+        elif self.method == "semantic" and self.semantic_embeddings == "local":
+            return LocalSemanticSplitter(cache=self.embedding_cache)
         elif self.method == "semantic":
             if self.embeddings is None:
                 try:
@@ -70,12 +188,14 @@ class DocumentChunker:
                         f"SemanticChunker requires embeddings. "
                         f"Either provide embeddings parameter or set OPENAI_API_KEY. Error: {e}"
                     )
+            if self.embedding_cache is not None:
+                self.embeddings = CachedEmbeddings(self.embeddings, self.embedding_cache)
             return SemanticChunker(
                 embeddings=self.embeddings,
                 buffer_size=1,
             )
         else:
-            raise ValueError(f"Unknown method: {self.method}. Choose from: recursive, markdown, semantic")
+            raise ValueError(f"Unknown method: {self.method}. Choose from: recursive, markdown, semantic, structure")
     
     def _get_doc_metadata(self, doc_id: str) -> Dict[str, Any]:
         """Get metadata for a document from registry."""
@@ -89,52 +209,244 @@ class DocumentChunker:
             }
         return self.registry_data[doc_id]
     
-    def chunk_file(self, md_path: Path) -> List[Dict[str, Any]]:
-        """Chunks a single markdown file and returns list of chunk dictionaries."""
-        text = md_path.read_text(encoding='utf-8', errors='ignore')
-        checksum = utils.calculate_sha256(md_path)
+    def _read_source(self, md_path: Path) -> Tuple[str, str]:
+        """Read a markdown file once and return (text, sha256 of its bytes)."""
+        raw = md_path.read_bytes()
+        return raw.decode('utf-8', errors='ignore'), content_sha256(raw)
+
+    @staticmethod
+    def meta_path_for(md_path: Path) -> Path:
+        """Marker's *_meta.json next to the markdown (table of contents, page stats)."""
+        return md_path.with_name(f"{utils.extract_doc_id_from_path(md_path)}_meta.json")
+
+    def _split(self, text: str, md_path: Path) -> List[Union[str, Dict[str, Any]]]:
+        if isinstance(self.splitter, MarkdownStructureSplitter):
+            doc_id = utils.extract_doc_id_from_path(md_path)
+            return self.splitter.split(text, doc_id, load_toc_pages(self.meta_path_for(md_path)))
+        if isinstance(self.splitter, LocalSemanticSplitter):
+            return self.splitter.split_text(text)
+        if self.method == "semantic":
+            from langchain_core.documents import Document
+            doc = Document(page_content=text, metadata={"source": str(md_path)})
+            chunks = self.splitter.split_documents([doc])
+            return [chunk.page_content for chunk in chunks]
+        return self.splitter.split_text(text)
+
+    def iter_chunk_records(
+        self,
+        md_path: Path,
+        checksum: str,
+        chunk_texts: List[Union[str, Dict[str, Any]]],
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Yield the chunk records of one document for the given chunk texts. A chunk
+        given as a dict (structure method) contributes its extra fields to the record.
+        """
         doc_id = utils.extract_doc_id_from_path(md_path)
         short_id = str(doc_id).replace("DOC_paper_", "")
         metadata = self._get_doc_metadata(doc_id)
         
         # Use registry checksum if available, otherwise use calculated one
         file_checksum = metadata.get('checksum_sha256') or checksum
+        source_path = str(md_path.resolve())
         
-        # Split into chunks
-        if self.method == "semantic":
-            from langchain_core.documents import Document
-            doc = Document(page_content=text, metadata={"source": str(md_path)})
-            chunks = self.splitter.split_documents([doc])
-            chunk_texts = [chunk.page_content for chunk in chunks]
-        else:
-            chunk_texts = self.splitter.split_text(text)
-        
-        # Create chunk records
-        chunk_records = []
-        for idx, chunk_text in enumerate(chunk_texts, start=1):
-            chunk_id = f"CHUNK_{short_id}_{idx:04d}"
-            
-            chunk_record = {
+        for idx, chunk in enumerate(chunk_texts, start=1):
+            extra = dict(chunk) if isinstance(chunk, dict) else {'text': chunk}
+            record = {
                 'doc_id': doc_id,
-                'chunk_id': chunk_id,
-                'text': chunk_text,
+                'chunk_id': f"CHUNK_{short_id}_{idx:04d}",
+                'text': extra.pop('text'),
                 'site_ids': metadata['site_ids'],
                 'concept_ids': metadata['concept_ids'],
                 'license': metadata['license'],
-                'source_path': str(md_path.resolve()),
+                'source_path': source_path,
                 'registry_path': DocumentChunker.REGISTRY_PATH_OUTPUT,
                 'checksum_sha256': file_checksum,
             }
-            chunk_records.append(chunk_record)
+            record.update(extra)
+            yield record
+    
+    def chunk_file(self, md_path: Path) -> List[Dict[str, Any]]:
+        """Chunks a single markdown file and returns list of chunk dictionaries."""
+        text, checksum = self._read_source(md_path)
+        return list(self.iter_chunk_records(md_path, checksum, self._split(text, md_path)))
+    
+    def output_header(self, md_path: Path, checksum: str) -> Dict[str, Any]:
+        """
+        Header written as the first JSONL line: everything the chunks depend on.
+        A later run with an identical header leaves the file untouched.
+        """
+        doc_id = utils.extract_doc_id_from_path(md_path)
+        header = {
+            'format': CHUNKS_FORMAT_VERSION,
+            'source_sha256': checksum,
+            'method': self.method,
+            'chunk_size': self.chunk_size,
+            'chunk_overlap': self.chunk_overlap,
+            'metadata_sha256': utils.fingerprint(json.dumps(self.registry_data.get(doc_id), sort_keys=True, default=str)),
+        }
+        if self.store_embeddings:
+            header['stored_embeddings'] = em.text_embedding_id()
+        if isinstance(self.splitter, MarkdownStructureSplitter):
+            meta_path = self.meta_path_for(md_path)
+            header['meta_sha256'] = utils.calculate_sha256(meta_path) if meta_path.exists() else None
+        elif isinstance(self.splitter, LocalSemanticSplitter):
+            header['embeddings'] = em.text_embedding_id()
+            header['breakpoint_percentile'] = self.splitter.breakpoint_percentile
+        elif self.method == "semantic":
+            header['embeddings'] = (
+                getattr(self.embeddings, 'model_name', None)
+                or getattr(self.embeddings, 'model', None)
+                or type(self.embeddings).__name__
+            )
+        return header
+    
+    def output_path_for(self, md_path: Path, output_dir: Optional[Path] = None) -> Path:
+        """JSONL next to the markdown by default; columnar files go to the shared chunk store."""
+        doc_id = utils.extract_doc_id_from_path(md_path)
+        if self.output_format == "jsonl":
+            return (output_dir or md_path.parent) / f"{doc_id}_chunks.jsonl"
+        store_dir = output_dir or chunk_store.default_store_dir(self.get_liacara_root())
+        return chunk_store.store_path(store_dir, doc_id, self.output_format)
+    
+    def _read_output_header(self, output_path: Path) -> Optional[Dict[str, Any]]:
+        if self.output_format == "jsonl":
+            return utils.read_chunks_header(output_path)
+        return chunk_store.read_header(output_path)
+    
+    def process_files(
+        self,
+        md_paths: List[Path],
+        output_dir: Optional[Path] = None,
+        force: bool = False,
+    ) -> List[Any]:
+        """
+        Chunk several files into their outputs. Returns one entry per file: a
+        (status, n_chunks, output_path) tuple with status "chunked" or "skipped" (header
+        unchanged; n_chunks is then 0), or the Exception that file raised.
+        With the local semantic splitter, the sentences of all changed files are
+        embedded together; so are the chunks when store_embeddings is set.
+        """
+        results: List[Any] = [None] * len(md_paths)
+        pending = []
+        for i, md_path in enumerate(md_paths):
+            try:
+                output_path = self.output_path_for(md_path, output_dir)
+                text, checksum = self._read_source(md_path)
+                header = self.output_header(md_path, checksum)
+                if not force and self._read_output_header(output_path) == header:
+                    results[i] = ("skipped", 0, output_path)
+                else:
+                    pending.append((i, md_path, output_path, text, checksum, header))
+            except Exception as e:
+                results[i] = e
         
-        return chunk_records
+        if isinstance(self.splitter, LocalSemanticSplitter) and pending:
+            try:
+                split = self.splitter.split_texts([p[3] for p in pending])
+            except Exception as e:
+                for p in pending:
+                    results[p[0]] = e
+                return results
+        else:
+            split = [None] * len(pending)
+        
+        written = []
+        for (i, md_path, output_path, text, checksum, header), chunk_texts in zip(pending, split):
+            try:
+                if chunk_texts is None:
+                    chunk_texts = self._split(text, md_path)
+                records = self.iter_chunk_records(md_path, checksum, chunk_texts)
+                if self.output_format == "jsonl":
+                    n_chunks = self._write_output(output_path, header, records)
+                    results[i] = ("chunked", n_chunks, output_path)
+                else:
+                    written.append((i, output_path, header, list(records)))
+            except Exception as e:
+                results[i] = e
+        
+        if written:
+            vectors = [None] * len(written)
+            if self.store_embeddings:
+                try:
+                    all_vecs = em.embed_texts(
+                        [r['text'] for _, _, _, recs in written for r in recs], cache=self.embedding_cache
+                    )
+                except Exception as e:
+                    for i, *_ in written:
+                        results[i] = e
+                    return results
+                bounds = np.cumsum([0] + [len(recs) for _, _, _, recs in written])
+                vectors = [all_vecs[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+            for (i, output_path, header, recs), vecs in zip(written, vectors):
+                try:
+                    n_chunks = chunk_store.write_chunks(
+                        output_path, recs, header,
+                        embeddings=vecs,
+                        embedding_model=header.get('stored_embeddings'),
+                    )
+                    results[i] = ("chunked", n_chunks, output_path)
+                except Exception as e:
+                    results[i] = e
+        return results
+    
+    def process_file(self, md_path: Path, output_dir: Optional[Path] = None, force: bool = False) -> Tuple[str, int, Path]:
+        """Chunk one file; see process_files. Raises on failure."""
+        (result,) = self.process_files([md_path], output_dir, force)
+        if isinstance(result, Exception):
+            raise result
+        return result
     
-    def process_all_files(self, output_dir: Optional[Path] = None) -> Dict[str, int]:
-        """Process all markdown files in ARTICLES_ROOT."""
-        stats = {'processed': 0, 'failed': 0, 'total_chunks': 0}
+    @staticmethod
+    def _write_output(output_path: Path, header: Dict[str, Any], records: Iterator[Dict[str, Any]]) -> int:
+        """Stream header + records to a temp file that replaces output_path when complete."""
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = output_path.with_name(f".{output_path.name}.{os.getpid()}.tmp")
+        n_chunks = 0
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps({utils.CHUNKS_HEADER_KEY: header}, ensure_ascii=False) + '\n')
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                    n_chunks += 1
+            tmp_path.replace(output_path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+        return n_chunks
+    
+    def _worker_config(self) -> Dict[str, Any]:
+        return {
+            'liacara_root': str(self.get_liacara_root()),
+            'method': self.method,
+            'chunk_size': self.chunk_size,
+            'chunk_overlap': self.chunk_overlap,
+            'semantic_embeddings': self.semantic_embeddings,
+            'output_format': self.output_format,
+            'store_embeddings': self.store_embeddings,
+            'cache_path': str(self.embedding_cache.path) if self.embedding_cache is not None else None,
+            'cache_max_entries': self.embedding_cache.max_entries if self.embedding_cache is not None else None,
+        }
+    
+    def process_all_files(
+        self,
+        output_dir: Optional[Path] = None,
+        workers: int = 1,
+        force: bool = False,
+        docs_per_batch: Optional[int] = None,
+    ) -> Dict[str, int]:
+        """
+        Process all markdown files in ARTICLES_ROOT, skipping files whose output header
+        (source checksum, registry metadata, chunker parameters) is unchanged.
+        With workers > 1 files are chunked in a process pool (the splitters are
+        pure-Python and CPU-bound); each worker builds its own DocumentChunker.
+        Files are handed out docs_per_batch at a time (default: 32 for the local
+        semantic splitter, so sentence embeddings batch across documents, else 1).
+        """
+        stats = {'processed': 0, 'skipped': 0, 'failed': 0, 'total_chunks': 0}
         
         articles_root = DocumentChunker.get_articles_root()
-        md_files = list(articles_root.glob("DOC_paper_*/DOC_paper_*.md"))
+        md_files = sorted(articles_root.glob("DOC_paper_*/DOC_paper_*.md"))
         
         if not md_files:
             print(f"No markdown files found in {articles_root}")
@@ -142,38 +454,74 @@ class DocumentChunker:
         
         print(f"Found {len(md_files)} markdown files to process")
         print(f"Using chunking method: {self.method}")
+        if workers > 1 and not self._default_embeddings:
+            print("Custom embeddings can't be shipped to worker processes; chunking serially.")
+            workers = 1
+        if docs_per_batch is None:
+            docs_per_batch = 32 if isinstance(self.splitter, LocalSemanticSplitter) else 1
+        groups = list(utils.batched(md_files, docs_per_batch))
         
-        for md_path in sorted(md_files):
-            try:
-                print(f"\nProcessing: {md_path.name}")
-                chunk_records = self.chunk_file(md_path)
-                
-                if output_dir:
-                    output_dir.mkdir(parents=True, exist_ok=True)
-                    doc_id = utils.extract_doc_id_from_path(md_path)
-                    output_path = output_dir / f"{doc_id}_chunks.jsonl"
-                else:
-                    doc_id = utils.extract_doc_id_from_path(md_path)
-                    output_path = md_path.parent / f"{doc_id}_chunks.jsonl"
-                
-                with open(output_path, 'w', encoding='utf-8') as f:
-                    for record in chunk_records:
-                        f.write(json.dumps(record, ensure_ascii=False) + '\n')
-                
-                print(f"  → Created {len(chunk_records)} chunks")
-                print(f"  → Saved to: {output_path}")
-                
-                stats['processed'] += 1
-                stats['total_chunks'] += len(chunk_records)
-                
-            except Exception as e:
-                print(f"  ! Failed to process {md_path.name}: {e}")
+        def record(md_path: Path, outcome) -> None:
+            if isinstance(outcome, Exception):
+                print(f"  ! Failed to process {md_path.name}: {outcome}")
                 stats['failed'] += 1
-                import traceback
-                traceback.print_exc()
+                traceback.print_exception(type(outcome), outcome, outcome.__traceback__)
+                return
+            status, n_chunks, output_path = outcome
+            if status == "skipped":
+                print(f"  = {md_path.name}: unchanged, skipped")
+                stats['skipped'] += 1
+                return
+            print(f"  → {md_path.name}: {n_chunks} chunks → {output_path}")
+            stats['processed'] += 1
+            stats['total_chunks'] += n_chunks
+        
+        if workers <= 1:
+            for group in groups:
+                for md_path, outcome in zip(group, self.process_files(list(group), output_dir, force)):
+                    record(md_path, outcome)
+            return stats
         
+        config = dict(self._worker_config(), workers=workers)
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_chunk_worker, initargs=(config,)
+        ) as ex:
+            futures = {ex.submit(_process_in_worker, list(group), output_dir, force): group for group in groups}
+            for fut in as_completed(futures):
+                group = futures[fut]
+                try:
+                    outcomes = fut.result()
+                except Exception as e:
+                    outcomes = [e] * len(group)
+                for md_path, outcome in zip(group, outcomes):
+                    record(md_path, outcome)
         return stats
 
+# ------------------ WORKER PROCESSES ------------------
+_WORKER_CHUNKER: Optional[DocumentChunker] = None
+
+def _init_chunk_worker(config: Dict[str, Any]) -> None:
+    """Build one DocumentChunker (registry, splitter, embedding cache) per worker process."""
+    global _WORKER_CHUNKER
+    # Share the cores between workers before the local encoder (torch) starts its thread pool
+    os.environ.setdefault("OMP_NUM_THREADS", str(max(1, (os.cpu_count() or 1) // config['workers'])))
+    DocumentChunker._LIACARA_ROOT = Path(config['liacara_root'])
+    cache = None
+    if config['cache_path']:
+        cache = EmbeddingCache(config['cache_path'], max_entries=config['cache_max_entries'])
+    _WORKER_CHUNKER = DocumentChunker(
+        method=config['method'],
+        chunk_size=config['chunk_size'],
+        chunk_overlap=config['chunk_overlap'],
+        embedding_cache=cache,
+        semantic_embeddings=config['semantic_embeddings'],
+        output_format=config['output_format'],
+        store_embeddings=config['store_embeddings'],
+    )
+
+def _process_in_worker(md_paths: List[Path], output_dir: Optional[Path], force: bool) -> List[Any]:
+    return _WORKER_CHUNKER.process_files(md_paths, output_dir, force)
+
 def main():
     """CLI entry point."""
     parser = argparse.ArgumentParser(
@@ -182,27 +530,81 @@ def main():
     parser.add_argument(
         "--method",
         type=str,
-        choices=["recursive", "markdown", "semantic"],
+        choices=["recursive", "markdown", "semantic", "structure"],
         default="recursive",
-        help="Chunking method to use (default: recursive)"
+        help="Chunking method to use; 'structure' follows headings, pages and figure captions "
+             "from Marker's *_meta.json and adds page/section_path/figure_id/is_caption (default: recursive)"
     )
     parser.add_argument(
         "--chunk-size",
         type=int,
         default=1000,
-        help="Chunk size for recursive and markdown methods (default: 1000)"
+        help="Chunk size for recursive, markdown and structure methods (default: 1000)"
     )
     parser.add_argument(
         "--chunk-overlap",
         type=int,
         default=200,
-        help="Chunk overlap for recursive and markdown methods (default: 200)"
+        help="Chunk overlap for recursive, markdown and structure methods (default: 200)"
     )
     parser.add_argument(
         "--output-dir",
         type=str,
         default=None,
-        help="Output directory for chunks (default: same directory as source file)"
+        help="Output directory for chunks (default: same directory as source file for jsonl, "
+             "Rag_Vault/chunk_store for parquet/arrow)"
+    )
+    parser.add_argument(
+        "--output-format",
+        type=str,
+        choices=["jsonl", "parquet", "arrow"],
+        default="jsonl",
+        help="Per-document JSONL, or one columnar file per document in the chunk store: "
+             "parquet (zstd) or arrow (uncompressed IPC, zero-copy memory maps) (default: jsonl)"
+    )
+    parser.add_argument(
+        "--store-embeddings",
+        action="store_true",
+        help="With parquet/arrow output, also store each chunk's local MiniLM embedding "
+             "so ingest.py can upsert without re-encoding"
+    )
+    parser.add_argument(
+        "--semantic-embeddings",
+        type=str,
+        choices=["openai", "local"],
+        default="openai",
+        help="Sentence embeddings for --method semantic: remote OpenAI, or the local MiniLM "
+             "encoder from embedding_models, batched across documents (default: openai)"
+    )
+    parser.add_argument(
+        "--docs-per-batch",
+        type=int,
+        default=None,
+        help="Files per chunking task; local semantic embeddings are batched across them "
+             "(default: 32 for local semantic, else 1)"
+    )
+    parser.add_argument(
+        "--embedding-cache",
+        type=str,
+        default=None,
+        help="SQLite embedding cache for semantic chunking and --store-embeddings "
+             "(default: <LIACARA>/.cache/embeddings.sqlite)"
+    )
+    parser.add_argument(
+        "--no-embedding-cache",
+        action="store_true",
+        help="Do not cache embeddings for semantic chunking or --store-embeddings"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Worker processes chunking files in parallel (default: 1)"
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Re-chunk every file, even when its output header is unchanged"
     )
     parser.add_argument(
         "--liacara-root",
@@ -220,21 +622,37 @@ def main():
     print(f"Registry path: {DocumentChunker.get_registry_path()}")
     print(f"Articles root: {DocumentChunker.get_articles_root()}")
     
+    cache = None
+    uses_local_encoder = args.method == "semantic" or (args.store_embeddings and args.output_format != "jsonl")
+    if uses_local_encoder and not args.no_embedding_cache:
+        cache_path = args.embedding_cache or default_cache_path(DocumentChunker.get_liacara_root())
+        cache = EmbeddingCache(cache_path)
+
     chunker = DocumentChunker(
         method=args.method,
         chunk_size=args.chunk_size,
-        chunk_overlap=args.chunk_overlap
+        chunk_overlap=args.chunk_overlap,
+        embedding_cache=cache,
+        semantic_embeddings=args.semantic_embeddings,
+        output_format=args.output_format,
+        store_embeddings=args.store_embeddings,
     )
     
     output_dir = Path(args.output_dir) if args.output_dir else None
-    stats = chunker.process_all_files(output_dir=output_dir)
+    stats = chunker.process_all_files(output_dir=output_dir, workers=args.workers, force=args.force,
+                                     docs_per_batch=args.docs_per_batch)
     
     print("\n" + "="*60)
     print("Processing Summary")
     print("="*60)
     print(f"Files processed: {stats['processed']}")
+    print(f"Files unchanged (skipped): {stats['skipped']}")
     print(f"Files failed: {stats['failed']}")
     print(f"Total chunks created: {stats['total_chunks']}")
+    if cache is not None:
+        if args.workers <= 1:
+            print(f"Embedding cache: {cache.stats()}")
+        cache.close()
     print("="*60)
 
 if __name__ == "__main__":
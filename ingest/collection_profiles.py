@@ -0,0 +1,101 @@
+# collection_profiles.py
+"""
+Named storage/index profiles for the Qdrant collections.
+
+  default            float32 vectors and HNSW graph in RAM (Qdrant defaults)
+  low-memory         int8 scalar-quantized vectors in RAM, float32 originals and HNSW
+                     on disk; searches oversample and rescore from the originals
+  low-memory-binary  1-bit binary quantization (32x smaller), heavier oversampling;
+                     best for the 512-d CLIP vectors, lossy for 384-d MiniLM
+  low-latency        int8 quantized + float32 vectors in RAM, denser graph (m=32,
+                     ef_construct=256), hnsw_ef=128 at search time
+
+Compare them with: python bench.py profiles --qdrant-url http://localhost:6333
+
+VectorStore recognises a collection's profile from its config (profile_of) and
+applies the profile's search_params to dense searches automatically.
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from qdrant_client import models
+
+@dataclass(frozen=True)
+class CollectionProfile:
+    name: str
+    hnsw_config: Optional[models.HnswConfigDiff] = None
+    optimizers_config: Optional[models.OptimizersConfigDiff] = None
+    quantization_config: Optional[models.QuantizationConfig] = None
+    on_disk_vectors: Optional[bool] = None
+    search_params: Optional[models.SearchParams] = None
+
+    def create_kwargs(self) -> Dict[str, Any]:
+        """Keyword arguments for VectorStore.create_or_recreate_collection."""
+        return {
+            "hnsw_config": self.hnsw_config,
+            "optimizers_config": self.optimizers_config,
+            "quantization_config": self.quantization_config,
+            "on_disk_vectors": self.on_disk_vectors,
+        }
+
+PROFILES: Dict[str, CollectionProfile] = {
+    # Qdrant's defaults, spelled out so switching back from another profile resets them
+    "default": CollectionProfile(
+        "default",
+        hnsw_config=models.HnswConfigDiff(m=16, ef_construct=100, on_disk=False),
+        on_disk_vectors=False,
+    ),
+    "low-memory": CollectionProfile(
+        "low-memory",
+        hnsw_config=models.HnswConfigDiff(m=16, ef_construct=100, on_disk=True),
+        quantization_config=models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=True)
+        ),
+        on_disk_vectors=True,
+        search_params=models.SearchParams(
+            quantization=models.QuantizationSearchParams(rescore=True, oversampling=2.0)
+        ),
+    ),
+    "low-memory-binary": CollectionProfile(
+        "low-memory-binary",
+        hnsw_config=models.HnswConfigDiff(m=16, ef_construct=100, on_disk=True),
+        quantization_config=models.BinaryQuantization(
+            binary=models.BinaryQuantizationConfig(always_ram=True)
+        ),
+        on_disk_vectors=True,
+        search_params=models.SearchParams(
+            quantization=models.QuantizationSearchParams(rescore=True, oversampling=4.0)
+        ),
+    ),
+    "low-latency": CollectionProfile(
+        "low-latency",
+        hnsw_config=models.HnswConfigDiff(m=32, ef_construct=256, on_disk=False),
+        quantization_config=models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=True)
+        ),
+        on_disk_vectors=False,
+        search_params=models.SearchParams(
+            hnsw_ef=128,
+            quantization=models.QuantizationSearchParams(rescore=True, oversampling=1.5),
+        ),
+    ),
+}
+
+def profile_of(config: models.CollectionConfig) -> Optional[CollectionProfile]:
+    """Profile whose quantization and HNSW settings the collection has, if any."""
+    for profile in PROFILES.values():
+        if type(profile.quantization_config) is not type(config.quantization_config):
+            continue
+        want, have = profile.hnsw_config, config.hnsw_config
+        if want is not None and (
+            (want.m, want.ef_construct, bool(want.on_disk)) != (have.m, have.ef_construct, bool(have.on_disk))
+        ):
+            continue
+        return profile
+    return None
+
+def get_profile(name: str) -> CollectionProfile:
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Unknown collection profile: {name}. Choose from: {', '.join(PROFILES)}")
@@ -0,0 +1,184 @@
+# embedding_cache.py
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Union
+import numpy as np
+
+def default_cache_path(liacara_root: Path) -> Path:
+    """Shared cache location used by ingest.py and chunker.py."""
+    return Path(liacara_root) / ".cache" / "embeddings.sqlite"
+
+def content_sha256(data: Union[str, bytes]) -> str:
+    """SHA256 of text (utf-8) or raw bytes, used as the content part of a cache key."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+# Eviction trims the cache to this fraction of max_entries
+EVICT_LOW_WATER = 0.95
+
+class EmbeddingCache:
+    """
+    Persistent SQLite cache of embedding vectors keyed by
+    (model name, preprocessing version, content SHA256).
+
+    Vectors are stored as raw float32 blobs. When the cache grows past max_entries,
+    the least recently used rows are evicted down to EVICT_LOW_WATER of it, so the
+    table is only counted again after that many more writes. hits/misses count
+    lookups since open.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS embeddings (
+            model       TEXT    NOT NULL,
+            version     TEXT    NOT NULL,
+            sha256      TEXT    NOT NULL,
+            dim         INTEGER NOT NULL,
+            vector      BLOB    NOT NULL,
+            last_access REAL    NOT NULL,
+            PRIMARY KEY (model, version, sha256)
+        );
+        CREATE INDEX IF NOT EXISTS embeddings_lru ON embeddings (last_access);
+    """
+
+    def __init__(self, path: Union[str, Path], max_entries: int = 2_000_000):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # Upper bound on the row count (rows written since the last COUNT); None until first put
+        self._rows_bound: Optional[int] = None
+        self._lock = threading.Lock()
+        # timeout: several ingest worker processes may write to the same cache file
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=60.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self._SCHEMA)
+
+    def get_many(self, model: str, version: str, hashes: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Return {sha256: vector} for the hashes present in the cache."""
+        found: Dict[str, np.ndarray] = {}
+        unique = list(dict.fromkeys(hashes))
+        now = time.time()
+        with self._lock:
+            # SQLite limits bound parameters per statement; query in slices
+            for start in range(0, len(unique), 500):
+                part = unique[start:start + 500]
+                marks = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT sha256, dim, vector FROM embeddings "
+                    f"WHERE model = ? AND version = ? AND sha256 IN ({marks})",
+                    (model, version, *part),
+                ).fetchall()
+                for sha, dim, blob in rows:
+                    found[sha] = np.frombuffer(blob, dtype=np.float32, count=dim)
+                if rows:
+                    self._conn.executemany(
+                        "UPDATE embeddings SET last_access = ? WHERE model = ? AND version = ? AND sha256 = ?",
+                        [(now, model, version, sha) for sha, _, _ in rows],
+                    )
+            self._conn.commit()
+            self.hits += sum(1 for h in hashes if h in found)
+            self.misses += sum(1 for h in hashes if h not in found)
+        return found
+
+    def put_many(self, model: str, version: str, hashes: Sequence[str], vectors: np.ndarray) -> None:
+        """Store one vector per hash, then evict LRU rows if over max_entries."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        now = time.time()
+        rows = [
+            (model, version, sha, int(vec.shape[0]), vec.tobytes(), now)
+            for sha, vec in zip(hashes, vectors)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, version, sha256, dim, vector, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._evict(len(rows))
+            self._conn.commit()
+
+    def _evict(self, added: int) -> None:
+        # Replaced rows count as added, so the bound only overestimates; the table is
+        # scanned only when it crosses max_entries. Rows other processes wrote are
+        # picked up by that recount.
+        if self._rows_bound is not None:
+            self._rows_bound += added
+            if self._rows_bound <= self.max_entries:
+                return
+        (n,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        if n > self.max_entries:
+            keep = int(self.max_entries * EVICT_LOW_WATER)
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN "
+                "(SELECT rowid FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+                (n - keep,),
+            )
+            n = keep
+        self._rows_bound = n
+
+    def __len__(self) -> int:
+        with self._lock:
+            (n,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        return n
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> str:
+        return f"{self.hits} hits, {self.misses} misses ({self.hit_rate:.1%} hit rate)"
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self) -> "EmbeddingCache":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+def cached_embed(
+    cache: Optional[EmbeddingCache],
+    model: str,
+    version: str,
+    hashes: List[str],
+    compute,
+    dim: Optional[int] = None,
+) -> np.ndarray:
+    """
+    Look up hashes in cache and call compute(indices) -> ndarray only for the misses.
+    Returns a (len(hashes), dim) float32 array in input order; dim is inferred from the
+    vectors when not given. Rows whose computed vector is all zeros (e.g. unreadable
+    images) are returned but not cached.
+    """
+    if cache is None:
+        return compute(list(range(len(hashes))))
+
+    found = cache.get_many(model, version, hashes)
+    missing = [i for i, h in enumerate(hashes) if h not in found]
+    computed = np.asarray(compute(missing), dtype=np.float32) if missing else None
+    if dim is None:
+        dim = computed.shape[1] if computed is not None else len(next(iter(found.values())))
+
+    out = np.zeros((len(hashes), dim), dtype=np.float32)
+    for i, h in enumerate(hashes):
+        vec = found.get(h)
+        if vec is not None:
+            out[i] = vec
+
+    if computed is not None:
+        out[missing] = computed
+        keep = [j for j in range(len(missing)) if np.any(computed[j])]
+        if keep:
+            # Identical contents in one call map to one row
+            uniq = {hashes[missing[j]]: computed[j] for j in keep}
+            cache.put_many(model, version, list(uniq.keys()), np.stack(list(uniq.values())))
+    return out
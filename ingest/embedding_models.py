@@ -1,35 +1,223 @@
 # embedding_models.py
-from typing import List
+"""
+Text (MiniLM) and image (CLIP ViT-B-32) encoders.
+
+Models are loaded lazily on first use, so importing this module is cheap and a job
+that only embeds text never loads CLIP. Call warmup() to load them up front.
+torch, sentence_transformers and open_clip are imported only when a model loads.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 import numpy as np
-import torch
 from PIL import Image
 from pathlib import Path
-from sentence_transformers import SentenceTransformer
-import open_clip
+
+import utils
+from embedding_cache import EmbeddingCache, cached_embed, content_sha256
 
 # ------------------ CONFIG ------------------
 TEXT_DIM = 384
 IMG_DIM = 512
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 TEXT_BATCH = 256
 IMG_BATCH = 64
+# Threads decoding/resizing images (PIL releases the GIL while decoding)
+IMG_WORKERS = min(8, os.cpu_count() or 1)
+CLIP_INPUT_SIZE = 224
+
+TEXT_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+TEXT_MAX_SEQ_LENGTH = 256
+# Padded-token budget per text forward pass (batch count x longest sequence in the batch)
+TEXT_MAX_TOKENS = 16384
+CLIP_MODEL_NAME = "ViT-B-32"
+CLIP_PRETRAINED = "openai"
+# Bump when tokenisation/normalisation or image preprocessing changes, to invalidate cached vectors
+TEXT_PREPROCESS_VERSION = "l2norm-v1"
+IMG_PREPROCESS_VERSION = "clip-rgb-draft-v2"
+
+# Inference backend: "torch" (fp32 PyTorch), "onnx" (ONNX Runtime fp32) or "onnx-int8"
+# (dynamically quantized weights). ONNX backends run on CPU; see onnx_backend.py.
+BACKENDS = ("torch", "onnx", "onnx-int8")
+_BACKEND = os.environ.get("EMBED_BACKEND", "torch")
+_ORT_THREADS = int(os.environ.get("EMBED_ORT_THREADS", "0"))
+
+# ------------------ MODELS (lazy, thread-safe singletons) ------------------
+_DEVICE: Optional[str] = None
+_TEXT_MODEL = None
+_CLIP: Optional[Tuple[Any, Any]] = None
+_CLIP_PREPROCESS = None
+_TOKENIZER = None
+_TEXT_LOCK = threading.Lock()
+_CLIP_LOCK = threading.Lock()
+
+def get_device() -> str:
+    global _DEVICE
+    if _DEVICE is None:
+        import torch
+        _DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+    return _DEVICE
+
+def get_text_model():
+    """The SentenceTransformer text encoder, loaded on first call."""
+    global _TEXT_MODEL
+    if _TEXT_MODEL is None:
+        with _TEXT_LOCK:
+            if _TEXT_MODEL is None:
+                from sentence_transformers import SentenceTransformer
+                print(f"Loading text model to {get_device()}...")
+                _TEXT_MODEL = SentenceTransformer(TEXT_MODEL_NAME, device=get_device()).eval()
+    return _TEXT_MODEL
+
+def get_tokenizer():
+    """The text model's tokenizer, without loading the PyTorch weights if not needed."""
+    global _TOKENIZER
+    if _TOKENIZER is None:
+        with _TEXT_LOCK:
+            if _TOKENIZER is None:
+                if _TEXT_MODEL is not None:
+                    _TOKENIZER = _TEXT_MODEL.tokenizer
+                else:
+                    from transformers import AutoTokenizer
+                    _TOKENIZER = AutoTokenizer.from_pretrained(TEXT_MODEL_NAME)
+    return _TOKENIZER
+
+def get_clip() -> Tuple[Any, Any]:
+    """(clip_model, clip_preprocess), loaded on first call."""
+    global _CLIP
+    if _CLIP is None:
+        with _CLIP_LOCK:
+            if _CLIP is None:
+                import open_clip
+                print(f"Loading CLIP model to {get_device()}...")
+                model, _, preprocess = open_clip.create_model_and_transforms(
+                    CLIP_MODEL_NAME, pretrained=CLIP_PRETRAINED, device=get_device()
+                )
+                model.eval()
+                _CLIP = (model, preprocess)
+    return _CLIP
 
-# ------------------ MODELS ------------------
-print(f"Loading models to {DEVICE}...")
-text_model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2", device=DEVICE).eval()
-clip_model, _, clip_preprocess = open_clip.create_model_and_transforms(
-    "ViT-B-32", pretrained="openai", device=DEVICE
-)
-clip_model.eval()
-print("Models loaded.")
+def get_clip_preprocess():
+    """CLIP image transform. The ONNX backends build it from open_clip's config instead of loading the model."""
+    global _CLIP_PREPROCESS
+    if _BACKEND == "torch" or _CLIP is not None:
+        return get_clip()[1]
+    if _CLIP_PREPROCESS is None:
+        with _CLIP_LOCK:
+            if _CLIP_PREPROCESS is None:
+                import open_clip
+                cfg = open_clip.get_pretrained_cfg(CLIP_MODEL_NAME, CLIP_PRETRAINED)
+                _CLIP_PREPROCESS = open_clip.image_transform(
+                    open_clip.get_model_config(CLIP_MODEL_NAME)["vision_cfg"]["image_size"],
+                    is_train=False,
+                    mean=cfg.get("mean"),
+                    std=cfg.get("std"),
+                    resize_mode=cfg.get("resize_mode"),
+                    interpolation=cfg.get("interpolation"),
+                )
+    return _CLIP_PREPROCESS
+
+def set_backend(name: str, threads: Optional[int] = None) -> None:
+    """Select the inference backend; threads sets ONNX Runtime intra-op threads (0 = auto)."""
+    global _BACKEND, _ORT_THREADS
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend: {name}. Choose from: {', '.join(BACKENDS)}")
+    _BACKEND = name
+    if threads is not None:
+        _ORT_THREADS = threads
+
+def get_backend() -> str:
+    return _BACKEND
+
+def _cache_model(base: str) -> str:
+    # Vectors from different backends differ slightly; keep their cache entries apart
+    return base if _BACKEND == "torch" else f"{base}@{_BACKEND}"
+
+def text_embedding_id() -> str:
+    """Identifies vectors from embed_texts (model, backend, preprocessing) when stored elsewhere."""
+    return f"{_cache_model(TEXT_MODEL_NAME)}@{TEXT_PREPROCESS_VERSION}"
+
+def warmup(text: bool = True, image: bool = True) -> None:
+    """Load the requested encoders now and run one tiny forward pass through each."""
+    if text:
+        _encode_texts(["warmup"])
+    if image:
+        _encode_tensors([get_clip_preprocess()(Image.new("RGB", (CLIP_INPUT_SIZE, CLIP_INPUT_SIZE)))])
+
+def __getattr__(name: str):
+    # Backwards-compatible module attributes that now load on first access
+    if name == "DEVICE":
+        return get_device()
+    if name == "text_model":
+        return get_text_model()
+    if name == "clip_model":
+        return get_clip()[0]
+    if name == "clip_preprocess":
+        return get_clip_preprocess()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # ------------------ EMBEDDING FUNCTIONS ------------------
-def embed_texts(texts: List[str]) -> np.ndarray:
-    """Embeds a list of texts, normalizing them for cosine similarity."""
+def embed_texts(texts: List[str], cache: Optional[EmbeddingCache] = None) -> np.ndarray:
+    """
+    Embeds a list of texts, normalizing them for cosine similarity.
+    With a cache, only texts whose SHA256 is not cached for this model are encoded.
+    """
+    hashes = [content_sha256(t) for t in texts]
+    return cached_embed(
+        cache, _cache_model(TEXT_MODEL_NAME), TEXT_PREPROCESS_VERSION, hashes,
+        lambda idx: _encode_texts([texts[i] for i in idx]), TEXT_DIM,
+    )
+
+def token_budget_batches(lengths: List[int], max_tokens: int, max_batch: int) -> List[List[int]]:
+    """
+    Group indices into batches, longest first, so that len(batch) * longest <= max_tokens
+    (always at least one item) and len(batch) <= max_batch. Similar lengths end up
+    together, so little compute is spent on padding.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    batches: List[List[int]] = []
+    current: List[int] = []
+    for i in order:
+        longest = lengths[current[0]] if current else lengths[i]
+        if current and ((len(current) + 1) * longest > max_tokens or len(current) >= max_batch):
+            batches.append(current)
+            current = []
+        current.append(i)
+    if current:
+        batches.append(current)
+    return batches
+
+def _encode_texts(texts: List[str]) -> np.ndarray:
+    """
+    Encode with duplicate texts collapsed and length-bucketed batches under the
+    TEXT_MAX_TOKENS budget; rows come back in input order.
+    """
+    if not texts:
+        return np.zeros((0, TEXT_DIM), dtype=np.float32)
+    unique = list(dict.fromkeys(texts))
+    position = {t: i for i, t in enumerate(unique)}
+    lengths = [
+        len(ids) for ids in get_tokenizer()(
+            unique, truncation=True, max_length=TEXT_MAX_SEQ_LENGTH, add_special_tokens=True
+        )["input_ids"]
+    ]
+    vecs = np.zeros((len(unique), TEXT_DIM), dtype=np.float32)
+    for batch in token_budget_batches(lengths, TEXT_MAX_TOKENS, TEXT_BATCH):
+        vecs[batch] = _encode_text_batch([unique[i] for i in batch])
+    return vecs[[position[t] for t in texts]]
+
+def _encode_text_batch(texts: List[str]) -> np.ndarray:
+    """One forward pass over texts (already bucketed by length)."""
+    if _BACKEND != "torch":
+        import onnx_backend
+        return onnx_backend.encode_texts(
+            texts, quantize=_BACKEND == "onnx-int8", threads=_ORT_THREADS, batch_size=len(texts)
+        )
+    import torch
     with torch.no_grad():
-        embs = text_model.encode(
+        embs = get_text_model().encode(
             texts, 
-            batch_size=TEXT_BATCH, 
+            batch_size=len(texts), 
             convert_to_numpy=True, 
             normalize_embeddings=False, # We normalize manually
             show_progress_bar=False
@@ -38,32 +226,146 @@ def embed_texts(texts: List[str]) -> np.ndarray:
     n = np.linalg.norm(embs, axis=1, keepdims=True) + 1e-12
     return (embs / n).astype(np.float32)
 
-def embed_images(paths: List[Path]) -> np.ndarray:
-    """Embeds a list of image paths, handling errors and returning normalized vectors."""
-    tensors = []
-    kept_idx = []
-    for i, p in enumerate(paths):
-        try:
-            img = Image.open(p).convert("RGB")
-            tensors.append(clip_preprocess(img))
-            kept_idx.append(i)
-        except Exception:
-            tensors.append(None) # Add a placeholder for failed images
-
-    if not kept_idx:
-        return np.zeros((len(paths), IMG_DIM), dtype=np.float32)
-
-    batch = torch.stack([t for t in tensors if t is not None]).to(DEVICE)
-    with torch.no_grad():
-        feats = clip_model.encode_image(batch)
-        feats = feats / feats.norm(dim=-1, keepdim=True) # Normalize
-    feats = feats.detach().cpu().numpy().astype(np.float32)
+def embed_images(paths: List[Path], cache: Optional[EmbeddingCache] = None) -> np.ndarray:
+    """
+    Embeds a list of image paths, handling errors and returning normalized vectors.
+    With a cache, images are keyed on the SHA256 of their bytes and only misses are encoded.
+    Unreadable images get zero vectors.
+    """
+    return _encode_prepared(_prepare_images(paths, cache), cache)
+
+def iter_image_embeddings(
+    paths: List[Path],
+    batch_size: int = IMG_BATCH,
+    cache: Optional[EmbeddingCache] = None,
+) -> Iterator[np.ndarray]:
+    """
+    Yield one (len(batch), IMG_DIM) array per batch of paths, in order.
+    The next batch is decoded/preprocessed in the background while the current
+    batch runs through CLIP.
+    """
+    batches = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+    if not batches:
+        return
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="img-prefetch") as prefetch:
+        pending = prefetch.submit(_prepare_images, batches[0], cache)
+        for k in range(len(batches)):
+            prepared = pending.result()
+            if k + 1 < len(batches):
+                pending = prefetch.submit(_prepare_images, batches[k + 1], cache)
+            yield _encode_prepared(prepared, cache)
+
+_DECODE_POOL: Optional[ThreadPoolExecutor] = None
+
+def _decode_pool() -> ThreadPoolExecutor:
+    global _DECODE_POOL
+    if _DECODE_POOL is None:
+        _DECODE_POOL = ThreadPoolExecutor(max_workers=IMG_WORKERS, thread_name_prefix="img-decode")
+    return _DECODE_POOL
+
+def _image_hash(p: Path) -> str:
+    try:
+        return utils.calculate_sha256(Path(p))
+    except OSError:
+        return f"unreadable:{p}" # never cached: unreadable images embed to zeros
+
+def _load_image(p: Path) -> Optional["torch.Tensor"]:
+    """Decode and preprocess one image; None if it cannot be read."""
+    try:
+        with Image.open(p) as img:
+            # JPEG: let libjpeg decode at a reduced scale (still >= the CLIP input size)
+            # instead of decoding 4000x3000 pixels only to resize them to 224
+            img.draft("RGB", (CLIP_INPUT_SIZE, CLIP_INPUT_SIZE))
+            return get_clip_preprocess()(img.convert("RGB"))
+    except Exception:
+        return None
+
+# (hashes or None, cached vectors by hash, indices to encode, their tensors or None)
+_Prepared = Tuple[Optional[List[str]], Dict[str, np.ndarray], List[int], List[Optional["torch.Tensor"]], int]
+
+def _prepare_images(paths: List[Path], cache: Optional[EmbeddingCache]) -> _Prepared:
+    """Cache lookup plus parallel decode of the misses."""
+    hashes: Optional[List[str]] = None
+    found: Dict[str, np.ndarray] = {}
+    if cache is not None:
+        hashes = list(_decode_pool().map(_image_hash, paths))
+        found = cache.get_many(_clip_cache_model(), IMG_PREPROCESS_VERSION, hashes)
+    missing = [i for i in range(len(paths)) if hashes is None or hashes[i] not in found]
+    tensors = list(_decode_pool().map(_load_image, [paths[i] for i in missing]))
+    return hashes, found, missing, tensors, len(paths)
+
+def _encode_prepared(prepared: _Prepared, cache: Optional[EmbeddingCache]) -> np.ndarray:
+    hashes, found, missing, tensors, n = prepared
+    out = np.zeros((n, IMG_DIM), dtype=np.float32)
+    if hashes is not None:
+        for i, h in enumerate(hashes):
+            if h in found:
+                out[i] = found[h]
+    if not missing:
+        return out
+
+    feats = _encode_tensors(tensors)
+    out[missing] = feats
+    if cache is not None:
+        keep = [j for j, t in enumerate(tensors) if t is not None]
+        if keep:
+            cache.put_many(
+                _clip_cache_model(), IMG_PREPROCESS_VERSION,
+                [hashes[missing[j]] for j in keep], feats[keep],
+            )
+    return out
+
+def _clip_cache_model() -> str:
+    return _cache_model(f"{CLIP_MODEL_NAME}/{CLIP_PRETRAINED}")
+
+def _encode_tensors(tensors: List[Optional["torch.Tensor"]]) -> np.ndarray:
+    """CLIP forward pass over preprocessed tensors; None entries (failed loads) become zeros."""
+    if not any(t is not None for t in tensors):
+        return np.zeros((len(tensors), IMG_DIM), dtype=np.float32)
+
+    import torch
+    if _BACKEND != "torch":
+        import onnx_backend
+        pixels = torch.stack([t for t in tensors if t is not None]).numpy()
+        feats = onnx_backend.encode_image_tensors(pixels, quantize=_BACKEND == "onnx-int8", threads=_ORT_THREADS)
+    else:
+        clip_model = get_clip()[0]
+        batch = torch.stack([t for t in tensors if t is not None]).to(get_device())
+        with torch.no_grad():
+            feats = clip_model.encode_image(batch)
+            feats = feats / feats.norm(dim=-1, keepdim=True) # Normalize
+        feats = feats.detach().cpu().numpy().astype(np.float32)
 
     # Restore original order, filling in zeros for failed loads
-    out = np.zeros((len(paths), IMG_DIM), dtype=np.float32)
+    out = np.zeros((len(tensors), IMG_DIM), dtype=np.float32)
     j = 0
-    for i in range(len(paths)):
+    for i in range(len(tensors)):
         if tensors[i] is not None:
             out[i] = feats[j]
             j += 1
     return out
+
+def check_parity(
+    backend: str,
+    texts: List[str],
+    image_paths: Optional[List[Path]] = None,
+) -> Dict[str, Dict[str, float]]:
+    """
+    Cosine agreement of backend vectors with the fp32 torch reference, e.g.
+    {"text": {"min": 0.991, "mean": 0.998}, "image": {...}}. No cache is used.
+    """
+    from onnx_backend import cosine_agreement
+    previous = _BACKEND
+    try:
+        set_backend("torch")
+        ref_t = embed_texts(texts)
+        ref_i = embed_images(image_paths) if image_paths else None
+        set_backend(backend)
+        got_t = embed_texts(texts)
+        got_i = embed_images(image_paths) if image_paths else None
+    finally:
+        set_backend(previous)
+    report = {"text": cosine_agreement(ref_t, got_t)}
+    if ref_i is not None:
+        report["image"] = cosine_agreement(ref_i, got_i)
+    return report
@@ -0,0 +1,101 @@
+# image_dedup.py
+"""
+Exact and near-duplicate grouping of images before CLIP embedding.
+
+Byte-identical files (same SHA-256, e.g. the _1/_2 copies pdf_parser_marker.copy_images
+makes in every bundle) are grouped first. The remaining distinct files are compared by
+a 64-bit difference hash (dHash) of their 9x8 grayscale thumbnail; two images within
+max_distance differing bits (default 4) are treated as the same picture. Candidate
+pairs are found by splitting the hash into max_distance + 1 bands: hashes that differ
+in at most max_distance bits agree exactly on at least one band.
+"""
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from PIL import Image
+
+DEDUP_MAX_DISTANCE = 4
+HASH_BITS = 64
+# Counter copy_images appends on name clashes: "Fig_3.png" -> "Fig_3_1.png", "Fig_3_2.png"
+COPY_SUFFIX_RE = re.compile(r"_\d+$")
+
+def dhash(path: Path) -> Optional[int]:
+    """Difference hash: one bit per horizontally adjacent pixel pair of a 9x8 thumbnail."""
+    try:
+        with Image.open(path) as img:
+            img.draft("L", (64, 64))
+            pixels = list(img.convert("L").resize((9, 8), Image.LANCZOS).getdata())
+    except Exception:
+        return None
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+def shard_by_copy_name(paths: Sequence[Path], n_shards: int) -> List[List[Path]]:
+    """Deal paths round-robin into n_shards, keeping each file with its numbered copies."""
+    present = set(paths)
+    groups: Dict[Path, List[Path]] = {}
+    for p in paths:
+        # Only a suffix whose unnumbered file exists is a copy counter ("Fig_1.png" is not)
+        original = p.with_name(COPY_SUFFIX_RE.sub("", p.stem) + p.suffix)
+        groups.setdefault(original if original in present else p, []).append(p)
+    shards: List[List[Path]] = [[] for _ in range(n_shards)]
+    for k, members in enumerate(groups.values()):
+        shards[k % n_shards].extend(members)
+    return shards
+
+def _bands(value: int, n_bands: int) -> List[Tuple[int, int]]:
+    width = -(-HASH_BITS // n_bands)
+    return [(b, (value >> (b * width)) & ((1 << width) - 1)) for b in range(n_bands)]
+
+def group_duplicates(
+    paths: Sequence[Path],
+    sha256s: Sequence[str],
+    max_distance: int = DEDUP_MAX_DISTANCE,
+    workers: int = 8,
+) -> Tuple[List[int], int, int]:
+    """
+    Map every path to the index of its group's representative (the first member).
+    max_distance < 0 groups exact duplicates only. Returns (representatives,
+    n_exact, n_near): how many paths were folded into another by hash or by dHash.
+    """
+    reps = list(range(len(paths)))
+    first_by_sha: Dict[str, int] = {}
+    for i, sha in enumerate(sha256s):
+        reps[i] = first_by_sha.setdefault(sha, i)
+    distinct = [i for i in range(len(paths)) if reps[i] == i]
+    n_exact = len(paths) - len(distinct)
+    if max_distance < 0 or len(distinct) < 2:
+        return reps, n_exact, 0
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dhash") as pool:
+        hashes = list(pool.map(dhash, [paths[i] for i in distinct]))
+
+    # Greedy: an image joins the first earlier representative within max_distance
+    n_bands = max_distance + 1
+    buckets: Dict[Tuple[int, int], List[Tuple[int, int]]] = {}
+    for i, h in zip(distinct, hashes):
+        if h is None:
+            continue
+        match = None
+        for band in _bands(h, n_bands):
+            for j, hj in buckets.get(band, ()):
+                if bin(h ^ hj).count("1") <= max_distance:
+                    match = j
+                    break
+            if match is not None:
+                break
+        if match is None:
+            for band in _bands(h, n_bands):
+                buckets.setdefault(band, []).append((i, h))
+        else:
+            reps[i] = match
+
+    # Exact copies follow their representative into its near-duplicate group
+    reps = [reps[r] for r in reps]
+    n_near = sum(1 for i in distinct if reps[i] != i)
+    return reps, n_exact, n_near
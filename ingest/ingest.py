@@ -1,14 +1,26 @@
 # ingest.py
+import argparse
+import multiprocessing as mp
+import os
+import threading
+import time
+from dataclasses import dataclass
 import numpy as np
 from pathlib import Path
 from tqdm import tqdm
 from qdrant_client import models
-from typing import List, Dict, Any
+from typing import Callable, List, Dict, Any, Optional, Tuple
 
 # Import from our new modules
-from vector_store import VectorStore
+from vector_store import VectorStore, BackgroundUpserter, stable_point_id
 import utils
+import chunk_store
+from sparse_encoder import BM25SparseEncoder, SPARSE_VECTOR_NAME, sparse_vectors_config
+from collection_profiles import PROFILES, CollectionProfile, get_profile
+from payload_schema import PAYLOAD_SCHEMAS
+import image_dedup
 import embedding_models as em
+from embedding_cache import EmbeddingCache, default_cache_path
 
 # ------------------ CONFIG ------------------
 _LIACARA_ROOT = utils.find_liacara_root()
@@ -19,150 +31,777 @@ ARTICLES_ROOT = _LIACARA_ROOT / "Rag_Vault" / "articles"
 IMAGES_DIR = str(_LIACARA_ROOT / "Media_Vault" / "images")
 MEDIA_REGISTRY_CSV = str(_LIACARA_ROOT / "Media_Vault" / "registry" / "media_registry.csv")
 REGISTRY_PATH_OUTPUT = "/LIACARA/Media_Vault/registry/media_registry.csv"
+INGEST_MANIFEST = _LIACARA_ROOT / "ingest_manifest.json"
+EMBEDDING_CACHE = default_cache_path(_LIACARA_ROOT)
+
+# ------------------ INCREMENTAL STATE ------------------
+class PointLedger:
+    """
+    Tracks key -> {"fp": fingerprint, "id": point id} for one collection across runs.
+    Point ids are stable UUIDv5s of the key, so a changed key overwrites its own point
+    and keys not seen in this run are reported as stale. A ledger opened without a
+    previous state (None, unlike an empty one) is not usable: its collection is rebuilt.
+    """
+
+    def __init__(self, previous: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.usable = previous is not None
+        self.previous = previous or {}
+        self.current: Dict[str, Dict[str, Any]] = {}
+
+    def is_unchanged(self, key: str, fp: str) -> bool:
+        prev = self.previous.get(key)
+        if prev is not None and prev["fp"] == fp:
+            self.current[key] = prev
+            return True
+        return False
+
+    def assign(self, key: str, fp: str) -> str:
+        point_id = stable_point_id(key)
+        self.current[key] = {"fp": fp, "id": point_id}
+        return point_id
+
+    def absorb(self, current: Dict[str, Dict[str, Any]]) -> None:
+        """Merge entries recorded by a worker's ledger (see run_shard)."""
+        self.current.update(current)
+
+    def stale_ids(self) -> List[str]:
+        return [e["id"] for k, e in self.previous.items() if k not in self.current]
+
+def open_ledger(vs: VectorStore, collection: str, manifest: Dict[str, Any], incremental: bool) -> PointLedger:
+    """Build the ledger for a collection; a manifest out of sync with Qdrant triggers a rebuild."""
+    if not incremental:
+        return PointLedger()
+    previous = manifest.get(collection)
+    collection = vs.resolve_alias(collection)
+    if previous is None or not vs.exists(collection):
+        print(f"No manifest entry or collection for '{collection}'; rebuilding it.")
+        return PointLedger()
+    stored = vs.count(collection, exact=True).count
+    if stored != len(previous):
+        print(f"Manifest lists {len(previous)} points for '{collection}' but Qdrant has {stored}; rebuilding it.")
+        return PointLedger()
+    if any(e["id"] != stable_point_id(k) for k, e in previous.items()):
+        print(f"Manifest for '{collection}' predates stable point ids; rebuilding it.")
+        return PointLedger()
+    if collection.startswith("rag_text_chunks") and stored and not vs.has_sparse_vector(collection, SPARSE_VECTOR_NAME):
+        print(f"'{collection}' has no '{SPARSE_VECTOR_NAME}' sparse vector yet; rebuilding it.")
+        return PointLedger()
+    return PointLedger(previous)
+
+def finish_ledger(
+    vs: VectorStore, collection: str, ledger: PointLedger, manifest: Dict[str, Any], target: Optional[str] = None
+) -> None:
+    """Delete points whose source disappeared and record the new state in the manifest."""
+    target = target or collection
+    stale = ledger.stale_ids()
+    if stale:
+        print(f"Deleting {len(stale)} stale points from '{target}'…")
+        vs.delete_points(target, stale)
+    manifest[collection] = ledger.current
+
+def build_target(vs: VectorStore, alias: str, ledger: PointLedger, version: str, blue_green: bool) -> str:
+    """
+    Collection to write for alias: a new version for full rebuilds with blue_green or
+    whenever alias already is an alias (recreating its collection would drop the
+    alias), otherwise the collection alias names, updated or recreated in place.
+    """
+    served = vs.resolve_alias(alias)
+    if not ledger.usable and (blue_green or served != alias):
+        return vs.versioned_name(alias, version)
+    return served
+
+def next_version(vs: VectorStore, aliases: List[str]) -> str:
+    """Timestamp version newer than every existing version of the aliases, so names sort by age."""
+    existing = [int(name.rsplit("_v", 1)[1]) for a in aliases for name in vs.collection_versions(a)]
+    return str(max([int(time.strftime("%Y%m%d%H%M%S"))] + [v + 1 for v in existing]))
+
+def verify_build(
+    vs: VectorStore, collection: str, expected_points: int, samples: Dict[Optional[str], List[float]]
+) -> None:
+    """Refuse to serve a new version that is missing points or has the wrong dimensions."""
+    stored = vs.count(collection, exact=True).count
+    if stored != expected_points:
+        raise RuntimeError(f"'{collection}' has {stored} points, expected {expected_points}")
+    for vector_name, vec in samples.items():
+        vs.assert_vector_dim(collection, vector_name, vec)
+
+PROFILES_KEY = "_profiles"
+def apply_payload_schema(vs: VectorStore, alias: str, target: str, wait: bool = True) -> None:
+    """Bring target's payload indexes in line with PAYLOAD_SCHEMAS[alias]."""
+    changed = vs.ensure_payload_indexes(target, PAYLOAD_SCHEMAS[alias], wait=wait)
+    for action in ("created", "replaced"):
+        fields = [f for f, a in changed.items() if a == action]
+        if fields:
+            print(f"  {action} payload indexes on '{target}': {', '.join(fields)}")
+
+def verify_payload_schema(vs: VectorStore, alias: str, target: str) -> None:
+    wrong = vs.check_payload_indexes(target, PAYLOAD_SCHEMAS[alias])
+    if wrong:
+        raise RuntimeError(f"Payload indexes of '{target}' don't match the schema: {', '.join(wrong)}")
+
+def index_progress(collection: str) -> Callable[[models.CollectionInfo], None]:
+    """tqdm reporter for VectorStore.wait_for_green: indexed vectors out of all dense vectors."""
+    bar = tqdm(desc=f"Indexing {collection}", unit="vec")
+
+    def report(info: models.CollectionInfo) -> None:
+        vectors = info.config.params.vectors
+        bar.total = (info.points_count or 0) * (len(vectors) if isinstance(vectors, dict) else 1)
+        bar.n = min(info.indexed_vectors_count or 0, bar.total)
+        bar.set_postfix_str(info.status.value)
+        if info.status == models.CollectionStatus.GREEN:
+            # Segments below indexing_threshold stay unindexed; green means done regardless
+            bar.n = bar.total
+            bar.close()
+
+    return report
+
+def apply_profile(
+    vs: VectorStore, collection: str, profile: CollectionProfile, manifest: Dict[str, Any], kept: bool
+) -> None:
+    """Switch a kept collection to the requested profile if it was built with another one."""
+    previous = (manifest.get(PROFILES_KEY) or {}).get(collection, "default")
+    if kept and previous != profile.name:
+        print(f"Switching '{collection}' from profile '{previous}' to '{profile.name}'; Qdrant re-indexes in the background.")
+        vs.update_collection_config(
+            collection,
+            hnsw_config=profile.hnsw_config,
+            optimizers_config=profile.optimizers_config,
+            quantization_config=profile.quantization_config,
+            on_disk_vectors=profile.on_disk_vectors,
+        )
+    manifest.setdefault(PROFILES_KEY, {})[collection] = profile.name
+
+# ------------------ TEXT PIPELINE ------------------
+# Progress callback: (kind, n) with kind "text" or "media"
+ProgressFn = Callable[[str, int], None]
+
+def iter_text_rows(
+    doc_dirs: List[Path],
+    store_dir: Optional[Path] = None,
+    store_format: str = "parquet",
+):
+    """
+    Yield (text, payload, vector) for every usable chunk record of the given documents,
+    from their JSONL files or, with store_dir, from the columnar chunk store. vector is
+    the chunk's stored embedding when it was made by the current text encoder, else None.
+    """
+    if store_dir is not None:
+        rows = chunk_store.iter_chunk_rows(store_dir, doc_ids=[d.name for d in doc_dirs], fmt=store_format)
+    else:
+        rows = utils.read_jsonl_from_doc_dirs(doc_dirs)
+    model_id = em.text_embedding_id()
+    for row in rows:
+        chunk_id = row.get("chunk_id") or row.get("id")
+        text = (row.get("text") or "").strip()
+        if not chunk_id or not text:
+            continue
+        vector = row.pop("embedding", None)
+        if row.pop("embedding_model", None) != model_id:
+            vector = None
+        payload = {k: v for k, v in row.items() if v is not None}
+        yield text, payload, vector
+
+def ingest_text_chunks(
+    vs: VectorStore,
+    upserter: BackgroundUpserter,
+    ledger: PointLedger,
+    cache: Optional[EmbeddingCache] = None,
+    collection: str = "rag_text_chunks",
+    doc_dirs: Optional[List[Path]] = None,
+    progress: Optional[ProgressFn] = None,
+    store_dir: Optional[Path] = None,
+    store_format: str = "parquet",
+) -> Tuple[Optional[List[float]], utils.StageStats]:
+    """
+    Stream chunk rows in TEXT_BATCH slices: embed each slice (dense MiniLM plus a
+    local BM25 sparse vector for lexical matching) and hand it to the
+    background upserter before reading the next, so memory stays bounded by the
+    in-flight batches regardless of corpus size and encoding overlaps with writes.
+    Rows whose whole record (text and metadata) matches the ledger are skipped.
+    doc_dirs restricts the run to a shard (default: every DOC_paper_* directory).
+    With store_dir, chunks are read from the columnar chunk store, and embeddings
+    stored there by the current encoder are upserted without re-encoding.
+    Returns one sample vector for the dimension guard (None if nothing was ingested)
+    and the per-stage throughput stats.
+    """
+    if doc_dirs is None:
+        doc_dirs = utils.iter_doc_dirs(ARTICLES_ROOT)
+    stats = utils.StageStats()
+    sample_vec: Optional[List[float]] = None
+    n_points = n_skipped = n_stored = 0
+    sparse = BM25SparseEncoder()
+
+    def changed_rows():
+        nonlocal n_skipped
+        for text, payload, vector in iter_text_rows(doc_dirs, store_dir, store_format):
+            key = payload.get("chunk_id") or payload.get("id")
+            # Whole record: license/tag/site edits must reach Qdrant, not just text edits
+            fp = utils.fingerprint(utils.canonical_json(payload), text)
+            if ledger.is_unchanged(key, fp):
+                n_skipped += 1
+                continue
+            yield ledger.assign(key, fp), text, payload, vector
+
+    if progress is None:
+        source = f"chunk store {store_dir}" if store_dir is not None else f"JSONL in {ARTICLES_ROOT}"
+        print(f"Reading text chunks of {len(doc_dirs)} documents from {source}…")
+    rows = stats.timed_iter(changed_rows(), "read")
+    with tqdm(desc="Ingesting text", unit="chunk", disable=progress is not None) as pbar:
+        for batch in utils.batched(rows, em.TEXT_BATCH):
+            ids = [b[0] for b in batch]
+            texts = [b[1] for b in batch]
+            payloads = [b[2] for b in batch] # Payloads already built during chunking
+
+            vectors = [b[3] for b in batch]
+            missing = [j for j, v in enumerate(vectors) if v is None]
+
+            t0 = time.perf_counter()
+            if len(missing) == len(batch):
+                emb = em.embed_texts(texts, cache=cache)
+            else:
+                # Vectors stored in the chunk store; encode only the rows without one
+                emb = np.zeros((len(batch), em.TEXT_DIM), dtype=np.float32)
+                for j, v in enumerate(vectors):
+                    if v is not None:
+                        emb[j] = v
+                if missing:
+                    emb[missing] = em.embed_texts([texts[j] for j in missing], cache=cache)
+            stats.add("embed", len(missing), time.perf_counter() - t0)
+            n_stored += len(batch) - len(missing)
+
+            t0 = time.perf_counter()
+            sparse_vecs = sparse.encode_documents(texts)
+            stats.add("sparse", len(texts), time.perf_counter() - t0)
+
+            t0 = time.perf_counter()
+            upserter.upsert_points(
+                collection, ids, {"": emb, SPARSE_VECTOR_NAME: sparse_vecs}, payloads, batch_size=em.TEXT_BATCH
+            )
+            stats.add("upsert", len(texts), time.perf_counter() - t0) # Time blocked on in-flight writes
+
+            if sample_vec is None:
+                sample_vec = emb[0].tolist()
+            n_points += len(texts)
+            pbar.update(len(texts))
+            if progress is not None:
+                progress("text", len(texts))
+
+    t0 = time.perf_counter()
+    upserter.flush()
+    stats.add("upsert", 0, time.perf_counter() - t0)
+
+    if progress is None:
+        print(f"Upserted {n_points} text points ({n_skipped} unchanged, skipped; "
+              f"{n_stored} with stored embeddings)")
+        print(f"Text throughput — {stats.summary()}")
+    return sample_vec, stats
+
+# ------------------ MEDIA PIPELINE ------------------
+def ingest_media(
+    vs: VectorStore,
+    upserter: BackgroundUpserter,
+    ledger: PointLedger,
+    cache: Optional[EmbeddingCache] = None,
+    collection: str = "media_assets",
+    img_paths: Optional[List[Path]] = None,
+    progress: Optional[ProgressFn] = None,
+    dedup_distance: int = image_dedup.DEDUP_MAX_DISTANCE,
+) -> Optional[Dict[str, List[float]]]:
+    """
+    Embed and upsert images (plus caption vectors) that are new or changed: file bytes
+    or registry row. img_paths restricts the run to a shard (default: every
+    image in IMAGES_DIR). Exact duplicates (same file bytes) and near duplicates (dHash
+    within dedup_distance bits, < 0 for exact only) are embedded once; every registry
+    row keeps its own point, with its own caption vector, and they share an
+    "image_group" payload value: the content hash of the group's first image, so byte
+    copies land in the same group in later runs too.
+    Returns one sample vector dict for the dimension guard.
+    """
+    log = print if progress is None else (lambda *a, **k: None)
+    registry = utils.load_media_registry(MEDIA_REGISTRY_CSV)
+    if img_paths is None:
+        img_paths = utils.list_images(IMAGES_DIR)
+        log(f"Found {len(img_paths)} images in {IMAGES_DIR}")
+
+    if not img_paths:
+        log("No images found to ingest.")
+        return None
+
+    # Select images whose file bytes or registry row changed since the last run
+    todo = []
+    for p in img_paths:
+        row = registry.get(p.name) or registry.get(p.stem) or {}
+        caption = (row.get("source_ref") or "").strip()
+        key = row.get("media_id") or p.stem
+        content_sha = utils.calculate_sha256(p)
+        fp = utils.fingerprint(content_sha, utils.canonical_json(row), caption)
+        if ledger.is_unchanged(key, fp):
+            continue
+        todo.append((ledger.assign(key, fp), p, row, caption, content_sha))
+
+    log(f"{len(todo)} new or changed images ({len(img_paths) - len(todo)} unchanged, skipped)")
+    if not todo:
+        return None
+
+    # Group duplicates by the files' own bytes (registry checksums may be stale or
+    # placeholders); only each group's first image goes through CLIP
+    todo_paths = [p for _, p, _, _, _ in todo]
+    content_shas = [sha for *_, sha in todo]
+    reps, n_exact, n_near = image_dedup.group_duplicates(
+        todo_paths, content_shas, max_distance=dedup_distance, workers=em.IMG_WORKERS
+    )
+    unique = sorted(set(reps))
+    log(f"Embedding {len(unique)} unique images ({n_exact} exact and {n_near} near duplicates reuse their vectors)")
+
+    # Embed images in batches (next batch is decoded while the current one is encoded)
+    unique_paths = [todo_paths[i] for i in unique]
+    n_batches = (len(unique_paths) + em.IMG_BATCH - 1) // em.IMG_BATCH
+    image_vectors_list: List[np.ndarray] = []
+    for vec in tqdm(
+        em.iter_image_embeddings(unique_paths, batch_size=em.IMG_BATCH, cache=cache),
+        total=n_batches, desc="Embedding images", disable=progress is not None,
+    ):
+        image_vectors_list.append(vec)
+        if progress is not None:
+            progress("media", len(vec))
+
+    # Fan each group's vector out to all of its members
+    position = {i: k for k, i in enumerate(unique)}
+    image_vectors = np.vstack(image_vectors_list).astype(np.float32)[[position[r] for r in reps]]
+
+    # Embed captions
+    caption_texts = [caption for _, _, _, caption, _ in todo]
+    caption_vectors = em.embed_texts([t or "" for t in caption_texts], cache=cache)
+
+    # Build payloads; vectors stay in the float32 arrays
+    point_ids, media_payloads = [], []
+    for i, (point_id, p, row, caption, _) in enumerate(todo):
+        media_id = row.get("media_id") or p.stem
+        source_path = row.get("path") or str(p.resolve())
+
+        payload = {
+            "media_id": media_id,
+            "site_ids": utils.to_tags(row.get("site_ids")),
+            "concept_ids": utils.to_tags(row.get("concept_ids")),
+            "source_path": source_path,
+            "registry_path": REGISTRY_PATH_OUTPUT,
+            "license": row.get("license") or "",
+            "checksum_sha256": row.get("checksum_sha256") or "",
+            "sensitivity": row.get("sensitivity") or "",
+            "asset_type": row.get("media_type") or "image",
+            "parent_doc_id": row.get("parent_ids") or None,
+            "image_uri": p.resolve().as_uri(),
+            "caption_text": caption or "",
+            "width": utils.to_int(row.get("width")),
+            "height": utils.to_int(row.get("height")),
+            "image_group": content_shas[reps[i]],
+        }
+        point_ids.append(point_id)
+        media_payloads.append(payload)
+
+    # Only add a caption vector where caption text exists: upsert the two groups separately
+    log(f"Upserting {len(point_ids)} media points…")
+    has_caption = np.array([bool(c) for c in caption_texts])
+    for with_caption in (True, False):
+        idx = np.flatnonzero(has_caption == with_caption)
+        if len(idx) == 0:
+            continue
+        vecs = {"image": image_vectors[idx]}
+        if with_caption:
+            vecs["caption"] = caption_vectors[idx]
+        upserter.upsert_points(
+            collection, [point_ids[i] for i in idx], vecs, [media_payloads[i] for i in idx], batch_size=256
+        )
+    upserter.flush()
+
+    sample = {"image": image_vectors[0].tolist()}
+    if has_caption[0]:
+        sample["caption"] = caption_vectors[0].tolist()
+    return sample
+
+# ------------------ SHARDED WORKERS ------------------
+@dataclass
+class ShardSpec:
+    """Work assigned to one ingest process."""
+    index: int
+    doc_dirs: List[Path]
+    img_paths: List[Path]
+    text_previous: Dict[str, Dict[str, Any]]
+    media_previous: Dict[str, Dict[str, Any]]
+    args: argparse.Namespace
+    text_collection: str = "rag_text_chunks"
+    media_collection: str = "media_assets"
+
+@dataclass
+class ShardResult:
+    index: int
+    text_entries: Dict[str, Dict[str, Any]]
+    media_entries: Dict[str, Dict[str, Any]]
+    text_stats: utils.StageStats
+    text_sample: Optional[List[float]] = None
+    media_sample: Optional[Dict[str, List[float]]] = None
+    cache_stats: str = ""
+
+def _limit_threads(n_workers: int) -> None:
+    """Split the cores between workers before torch/onnxruntime create their thread pools."""
+    per_worker = str(max(1, (os.cpu_count() or 1) // n_workers))
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = per_worker
+
+def run_shard(spec: ShardSpec, progress_queue=None) -> ShardResult:
+    """Ingest one shard with its own models, embedding cache handle and Qdrant connection."""
+    args = spec.args
+    progress: Optional[ProgressFn] = None
+    if progress_queue is not None:
+        _limit_threads(args.workers)
+        progress = lambda kind, n: progress_queue.put((kind, n))
+    threads = args.intra_op_threads
+    if progress_queue is not None and not threads:
+        threads = max(1, (os.cpu_count() or 1) // args.workers)
+    em.set_backend(args.backend, threads=threads)
+
+    vs = VectorStore(url=QDRANT_URL)
+    cache = None
+    if not args.no_embedding_cache:
+        cache = EmbeddingCache(args.embedding_cache, max_entries=args.embedding_cache_max_entries)
+    text_ledger = PointLedger(spec.text_previous)
+    media_ledger = PointLedger(spec.media_previous)
+
+    with vs.background_upserter(
+        parallelism=args.upsert_parallelism,
+        max_in_flight=args.upsert_in_flight,
+        wait=not (args.no_upsert_wait or args.bulk_load),
+    ) as upserter:
+        # Text streamed: each TEXT_BATCH is embedded and upserted right away
+        text_sample, text_stats = ingest_text_chunks(
+            vs, upserter, text_ledger, cache, spec.text_collection, doc_dirs=spec.doc_dirs, progress=progress,
+            store_dir=Path(args.chunk_store) if args.chunk_store else None,
+            store_format=args.chunk_store_format,
+        )
+        media_sample = ingest_media(
+            vs, upserter, media_ledger, cache, spec.media_collection, img_paths=spec.img_paths, progress=progress,
+            dedup_distance=args.image_dedup_distance,
+        )
+
+    cache_stats = ""
+    if cache is not None:
+        cache_stats = f"{cache.stats()}, {len(cache)} entries in {cache.path}"
+        cache.close()
+    return ShardResult(
+        index=spec.index,
+        text_entries=text_ledger.current,
+        media_entries=media_ledger.current,
+        text_stats=text_stats,
+        text_sample=text_sample,
+        media_sample=media_sample,
+        cache_stats=cache_stats,
+    )
+
+def run_shards(specs: List[ShardSpec]) -> List[ShardResult]:
+    """Run shards in spawned processes; a coordinator thread merges their progress."""
+    ctx = mp.get_context("spawn") # fresh interpreters: no forked torch/HTTP state
+    with ctx.Manager() as manager:
+        queue = manager.Queue()
+        bars = {
+            "text": tqdm(desc="Ingesting text", unit="chunk", position=0),
+            "media": tqdm(desc="Embedding images", unit="img", position=1),
+        }
+
+        def pump():
+            while True:
+                msg = queue.get()
+                if msg is None:
+                    return
+                kind, n = msg
+                bars[kind].update(n)
+
+        pumper = threading.Thread(target=pump, daemon=True)
+        pumper.start()
+        try:
+            with ctx.Pool(processes=len(specs)) as pool:
+                results = pool.starmap(run_shard, [(spec, queue) for spec in specs])
+        finally:
+            queue.put(None)
+            pumper.join()
+            for bar in bars.values():
+                bar.close()
+    return results
 
 # ------------------ MAIN PIPELINE ------------------
 def main():
+    parser = argparse.ArgumentParser(description="Embed LIACARA text chunks and media into Qdrant.")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Keep existing collections and only embed/upsert new or changed chunks and images, "
+             "deleting those that disappeared (state kept in the ingest manifest)"
+    )
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        default=str(INGEST_MANIFEST),
+        help=f"Path of the ingest manifest (default: {INGEST_MANIFEST})"
+    )
+    parser.add_argument(
+        "--embedding-cache",
+        type=str,
+        default=str(EMBEDDING_CACHE),
+        help=f"SQLite embedding cache keyed by model + content hash (default: {EMBEDDING_CACHE})"
+    )
+    parser.add_argument(
+        "--embedding-cache-max-entries",
+        type=int,
+        default=2_000_000,
+        help="Evict least recently used vectors beyond this many entries (default: 2000000)"
+    )
+    parser.add_argument(
+        "--no-embedding-cache",
+        action="store_true",
+        help="Always run the models, without reading or writing the embedding cache"
+    )
+    parser.add_argument(
+        "--upsert-parallelism",
+        type=int,
+        default=2,
+        help="Concurrent upsert requests to Qdrant (default: 2)"
+    )
+    parser.add_argument(
+        "--upsert-in-flight",
+        type=int,
+        default=4,
+        help="Max upsert batches queued or running before the encoder blocks (default: 4)"
+    )
+    parser.add_argument(
+        "--no-upsert-wait",
+        action="store_true",
+        help="Don't wait for Qdrant to apply each batch (wait=False); faster, errors surface later"
+    )
+    parser.add_argument(
+        "--backend",
+        type=str,
+        choices=list(em.BACKENDS),
+        default=em.get_backend(),
+        help="Encoder inference backend; onnx/onnx-int8 run on CPU via ONNX Runtime "
+             "(check with: python bench.py backends) (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--intra-op-threads",
+        type=int,
+        default=0,
+        help="ONNX Runtime intra-op threads for the onnx backends (default: 0 = auto)"
+    )
+    parser.add_argument(
+        "--chunk-store",
+        type=str,
+        nargs="?",
+        const=str(chunk_store.default_store_dir(_LIACARA_ROOT)),
+        default=None,
+        help="Read text chunks from the columnar chunk store written by "
+             "chunker.py --output-format parquet/arrow instead of the per-document JSONL "
+             f"(default dir when given without a value: {chunk_store.default_store_dir(_LIACARA_ROOT)})"
+    )
+    parser.add_argument(
+        "--chunk-store-format",
+        type=str,
+        choices=list(chunk_store.FORMATS),
+        default="parquet",
+        help="File format of --chunk-store (default: parquet)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Worker processes; DOC_paper_* directories and images are sharded across them, "
+             "each with its own models and Qdrant connection (default: 1)"
+    )
+    parser.add_argument(
+        "--profile",
+        type=str,
+        choices=list(PROFILES),
+        default="default",
+        help="Storage/index profile for both collections (quantization, on-disk vectors, HNSW); "
+             "see collection_profiles.py and python bench.py profiles (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--bulk-load",
+        action="store_true",
+        help="Turn HNSW indexing off while loading and upsert with wait=False, then build the "
+             "vector and payload indexes once at the end and wait until both collections are green"
+    )
+    parser.add_argument(
+        "--image-dedup-distance",
+        type=int,
+        default=image_dedup.DEDUP_MAX_DISTANCE,
+        help="Images whose 64-bit dHash differs in at most this many bits share one CLIP embedding; "
+             "-1 collapses byte-identical images only (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--blue-green",
+        action="store_true",
+        help="Rebuild into new versioned collections (e.g. rag_text_chunks_v20261018093000) and, "
+             "once they are indexed and verified, atomically point the rag_text_chunks/media_assets "
+             "aliases at them; incremental updates with a usable manifest still go in place. "
+             "Once the aliases exist, every full rebuild goes through a new version"
+    )
+    parser.add_argument(
+        "--keep-versions",
+        type=int,
+        default=1,
+        help="With --blue-green, previous versions to keep for rollback; older ones are deleted (default: 1)"
+    )
+    args = parser.parse_args()
+
     vs = VectorStore(url=QDRANT_URL)
+    manifest_path = Path(args.manifest)
+    manifest = utils.load_json_manifest(manifest_path) if args.incremental else {}
+    text_ledger = open_ledger(vs, "rag_text_chunks", manifest, args.incremental)
+    media_ledger = open_ledger(vs, "media_assets", manifest, args.incremental)
+    profile = get_profile(args.profile)
+
+    # Physical collection behind each alias for this run
+    version = next_version(vs, ["rag_text_chunks", "media_assets"])
+    text_target = build_target(vs, "rag_text_chunks", text_ledger, version, args.blue_green)
+    media_target = build_target(vs, "media_assets", media_ledger, version, args.blue_green)
+    targets = {"rag_text_chunks": text_target, "media_assets": media_target}
+    new_versions = {alias: t for alias, t in targets.items() if t != vs.resolve_alias(alias)}
 
-    # 1) CREATE collections
-    print("Creating 'rag_text_chunks' collection...")
+    t_start = time.perf_counter()
+    # 1) CREATE collections (recreated unless an incremental run has a usable ledger)
+    print(f"Creating '{text_target}' collection...")
     vs.create_or_recreate_collection(
-        "rag_text_chunks",
+        text_target,
         vectors=(em.TEXT_DIM, models.Distance.COSINE),
+        sparse_vectors=sparse_vectors_config(),
         on_disk_payload=True,
-        force=True,
+        force=not text_ledger.usable,
+        **profile.create_kwargs(),
     )
-    print("Creating 'media_assets' collection...")
+    apply_profile(vs, "rag_text_chunks", profile, manifest, kept=text_ledger.usable)
+    print(f"Creating '{media_target}' collection...")
     vs.create_or_recreate_collection(
-        "media_assets",
+        media_target,
         vectors={
             "image":  (em.IMG_DIM,   models.Distance.COSINE),
             "caption":(em.TEXT_DIM,  models.Distance.COSINE),
         },
         on_disk_payload=True,
-        force=True,
+        force=not media_ledger.usable,
+        **profile.create_kwargs(),
     )
+    apply_profile(vs, "media_assets", profile, manifest, kept=media_ledger.usable)
 
-    # 2) Add payload indexes
-    print("Creating payload indexes...")
-    for fld in ["doc_id", "page", "is_caption", "figure_id", "site_ids", "concept_ids", "license"]:
-        try: vs.create_payload_index("rag_text_chunks", fld)
-        except Exception: pass
-    #for fld in ["media_id", "site_ids", "concept_ids", "license", "sensitivity", "asset_type", "parent_doc_id", "page", "figure_id"]:
-    for fld in ["media_id", "site_ids", "concept_ids", "license", "sensitivity"]:
-        try: vs.create_payload_index("media_assets", fld)
-        except Exception: pass
-
-    # 3) INGEST TEXT
-    text_ids, text_vecs, text_payloads = [], [], []
-    buffer_texts, buffer_meta = [], []
+    # 2) Add payload indexes, or with --bulk-load switch indexing off until the data is in
+    if args.bulk_load:
+        print("Bulk load: indexing disabled until all points are written")
+        for name in (text_target, media_target):
+            vs.begin_bulk_load(name)
+    else:
+        for name in (text_target, media_target):
+            if vs.is_bulk_loading(name):
+                print(f"'{name}' was left with indexing disabled by an unfinished bulk load; re-enabling it.")
+                vs.end_bulk_load(name, wait=False)
+        print("Creating payload indexes...")
+        for alias, target in targets.items():
+            apply_payload_schema(vs, alias, target)
+    t_created = time.perf_counter()
 
-    print(f"Reading JSONL text chunks from {ARTICLES_ROOT}…")
-    for row in utils.read_jsonl_from_articles_root(ARTICLES_ROOT):
-        chunk_id = row.get("chunk_id") or row.get("id")
-        text = (row.get("text") or "").strip()
-        if not chunk_id or not text:
-            continue
-        
-        payload = {k: v for k, v in row.items() if v is not None}
-        buffer_texts.append(text)
-        buffer_meta.append(payload) #List dict of metadata 
-
-        if len(buffer_texts) >= em.TEXT_BATCH:
-            emb = em.embed_texts(buffer_texts)
-            for i in range(len(buffer_texts)):
-                text_ids.append(i)
-                text_vecs.append(emb[i].tolist())
-                text_payloads.append(buffer_meta[i])
-            buffer_texts.clear(); buffer_meta.clear()
-
-    if buffer_texts: # Process remainder
-        emb = em.embed_texts(buffer_texts)
-        for i in range(len(buffer_texts)):
-            #text_ids.append(buffer_meta[i]["chunk_id"])
-            text_ids.append(i+ len(text_ids))  # Use sequential IDs if chunk_id missing
-            text_vecs.append(emb[i].tolist())
-            text_payloads.append(buffer_meta[i]) #Get payloads from buffer_meta cause already processed during chunking
-
-    print(f"Upserting {len(text_ids)} text points…")
-    vs.upsert_points("rag_text_chunks", text_ids, text_vecs, text_payloads, batch_size=256)
-
-    # 4) INGEST IMAGES
-    registry = utils.load_media_registry(MEDIA_REGISTRY_CSV)
+    # 3) + 4) INGEST TEXT AND IMAGES, in one process or sharded across --workers processes
+    doc_dirs = utils.iter_doc_dirs(ARTICLES_ROOT)
     img_paths = utils.list_images(IMAGES_DIR)
-    print(f"Found {len(img_paths)} images in {IMAGES_DIR}")
+    n_workers = max(1, min(args.workers, max(len(doc_dirs), len(img_paths), 1)))
+    print(f"Ingesting {len(doc_dirs)} documents and {len(img_paths)} images with {n_workers} worker(s)")
+    # Numbered copies of an image land in the same shard so they are deduplicated together
+    img_shards = image_dedup.shard_by_copy_name(img_paths, n_workers)
+    specs = [
+        ShardSpec(
+            index=i,
+            doc_dirs=doc_dirs[i::n_workers],
+            img_paths=img_shards[i],
+            text_previous=text_ledger.previous,
+            media_previous=media_ledger.previous,
+            args=args,
+            text_collection=text_target,
+            media_collection=media_target,
+        )
+        for i in range(n_workers)
+    ]
+    t0 = time.perf_counter()
+    results = run_shards(specs) if n_workers > 1 else [run_shard(specs[0])]
+    elapsed = time.perf_counter() - t0
 
-    if not img_paths:
-        print("No images found to ingest.")
-    else:
-        # Embed images in batches
-        image_vectors_list: List[np.ndarray] = []
-        for start in tqdm(range(0, len(img_paths), em.IMG_BATCH), desc="Embedding images"):
-            batch_paths = img_paths[start:start + em.IMG_BATCH]
-            vec = em.embed_images(batch_paths)
-            image_vectors_list.append(vec)
-        
-        image_vectors = np.vstack(image_vectors_list).astype(np.float32)
-
-        # Embed captions
-        caption_texts = [
-            (registry.get(p.name) or registry.get(p.stem) or {}).get("source_ref", "").strip()
-            for p in img_paths
-        ]
-        caption_vectors = em.embed_texts([t or "" for t in caption_texts])
-
-        # Build and upsert points
-        media_ids, media_vecs, media_payloads = [], [], []
-        for i, p in enumerate(img_paths):
-            row = registry.get(p.name) or registry.get(p.stem) or {}
-            # media_id = row.get("media_id") or p.stem
-            media_id = i 
-            vec_dict = {"image": image_vectors[i].tolist()}
-            if caption_texts[i]: # Only add caption vector if text exists
-                vec_dict["caption"] = caption_vectors[i].tolist()
-
-            source_path = row.get("path") or str(p.resolve())
-            
-            payload = {
-                "media_id": media_id,
-                "site_ids": utils.to_tags(row.get("site_ids")),
-                "concept_ids": utils.to_tags(row.get("concept_ids")),
-                "source_path": source_path,
-                "registry_path": REGISTRY_PATH_OUTPUT,
-                "license": row.get("license") or "",
-                "checksum_sha256": row.get("checksum_sha256") or "",
-                "sensitivity": row.get("sensitivity") or "",
-                "asset_type": row.get("media_type") or "image",
-                "parent_doc_id": row.get("parent_ids") or None,
-                "image_uri": p.resolve().as_uri(),
-                "caption_text": caption_texts[i] or "",
-                "width": utils.to_int(row.get("width")),
-                "height": utils.to_int(row.get("height")),
-            }
-            media_ids.append(media_id)
-            media_vecs.append(vec_dict)
-            media_payloads.append(payload)
-
-        print(f"Upserting {len(media_ids)} media points…")
-        vs.upsert_points("media_assets", media_ids, media_vecs, media_payloads, batch_size=256)
-
-    # 5) Quick sanity
+    text_stats = utils.StageStats()
+    for res in results:
+        text_ledger.absorb(res.text_entries)
+        media_ledger.absorb(res.media_entries)
+        text_stats.merge(res.text_stats)
+    if n_workers > 1:
+        print(f"Shards done in {elapsed:.1f}s — text {text_stats.summary()}")
+        print(f"Aggregate: {text_stats.rows.get('upsert', 0) / max(elapsed, 1e-9):.1f} text chunks/s across {n_workers} workers")
+    text_sample_vec = next((r.text_sample for r in results if r.text_sample is not None), None)
+    media_sample_vec = next((r.media_sample for r in results if r.media_sample is not None), None)
+
+    finish_ledger(vs, "rag_text_chunks", text_ledger, manifest, text_target)
+    finish_ledger(vs, "media_assets", media_ledger, manifest, media_target)
+    t_loaded = time.perf_counter()
+
+    if args.bulk_load:
+        # Both collections build their indexes concurrently on the server
+        print("Building vector and payload indexes...")
+        for alias, target in targets.items():
+            vs.end_bulk_load(target, wait=False)
+            apply_payload_schema(vs, alias, target, wait=False)
+        for name in (text_target, media_target):
+            vs.wait_for_green(name, progress=index_progress(name))
+        t_indexed = time.perf_counter()
+        print(f"Bulk load phases — create: {t_created - t_start:.1f}s, load: {t_loaded - t_created:.1f}s, "
+              f"index build: {t_indexed - t_loaded:.1f}s, total: {t_indexed - t_start:.1f}s")
+
+    for alias, target in targets.items():
+        if alias not in new_versions:
+            verify_payload_schema(vs, alias, target)
+
+    # 5) BLUE/GREEN: serve the new versions only once they are fully indexed and verified
+    if new_versions:
+        samples = {
+            "rag_text_chunks": {None: text_sample_vec} if text_sample_vec is not None else {},
+            "media_assets": media_sample_vec or {},
+        }
+        ledgers = {"rag_text_chunks": text_ledger, "media_assets": media_ledger}
+        try:
+            for alias, target in new_versions.items():
+                vs.wait_for_green(target, progress=index_progress(target))
+                verify_build(vs, target, len(ledgers[alias].current), samples[alias])
+                verify_payload_schema(vs, alias, target)
+        except Exception:
+            for target in new_versions.values():
+                vs.client.delete_collection(collection_name=target)
+            raise
+        for alias, target in new_versions.items():
+            previous = vs.swap_alias(alias, target)
+            print(f"Alias '{alias}' -> '{target}'" + (f" (was '{previous}')" if previous else ""))
+            for old in vs.gc_collection_versions(alias, keep=args.keep_versions):
+                print(f"Deleted old version '{old}'")
+    utils.save_json_manifest(manifest_path, manifest)
+
+    # 6) Quick sanity
     print("--- Ingestion Complete ---")
     print(f"rag_text_chunks: {vs.count('rag_text_chunks')} points")
     print(f"media_assets:    {vs.count('media_assets')} points")
+    for res in results:
+        if res.cache_stats:
+            print(f"Embedding cache{f' (worker {res.index})' if n_workers > 1 else ''}: {res.cache_stats}")
 
-    # 6) Optional guards
+    # 7) Optional guards
     try:
-        if len(text_vecs) > 0:
-            vs.assert_vector_dim("rag_text_chunks", None, text_vecs[0])
-        if len(media_vecs) > 0:
-            vs.assert_vector_dim("media_assets", "image", media_vecs[0]["image"])
-            if "caption" in media_vecs[0]:
-                vs.assert_vector_dim("media_assets", "caption", media_vecs[0]["caption"])
+        if text_sample_vec is not None:
+            vs.assert_vector_dim(text_target, None, text_sample_vec)
+        if media_sample_vec is not None:
+            vs.assert_vector_dim(media_target, "image", media_sample_vec["image"])
+            if "caption" in media_sample_vec:
+                vs.assert_vector_dim(media_target, "caption", media_sample_vec["caption"])
         print("Vector dimensions verified.")
     except Exception as e:
         print(f"Warning: Could not verify vector dimensions: {e}")
 
-
 if __name__ == "__main__":
     main()
@@ -0,0 +1,154 @@
+# onnx_backend.py
+"""
+ONNX Runtime inference for the MiniLM text encoder and the CLIP image tower.
+
+The PyTorch models from embedding_models are exported once to ONNX_DIR, optionally
+dynamically quantized to int8 weights, and then served by CPU InferenceSessions with a
+configurable number of intra-op threads. Requires onnx and onnxruntime.
+"""
+import inspect
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+ONNX_DIR = Path(os.environ.get("EMBED_ONNX_DIR", Path.home() / ".cache" / "liacara" / "onnx"))
+OPSET = 17
+
+_SESSIONS: Dict[Tuple[str, bool, int], "object"] = {}
+_SESSIONS_LOCK = threading.Lock()
+
+def _onnx_export(*args, **kwargs) -> None:
+    import torch
+    # Newer torch defaults to the dynamo exporter; the TorchScript one handles these models as-is
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        kwargs["dynamo"] = False
+    torch.onnx.export(*args, **kwargs)
+
+def _export_text(path: Path) -> None:
+    import torch
+    import embedding_models as em
+
+    st = em.get_text_model()
+    transformer = st[0].auto_model.cpu().eval()
+    tok = st.tokenizer(["export"], return_tensors="pt")
+
+    class _Encoder(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+
+    _onnx_export(
+        _Encoder(transformer),
+        (tok["input_ids"], tok["attention_mask"]),
+        str(path),
+        input_names=["input_ids", "attention_mask"],
+        output_names=["last_hidden_state"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "seq"},
+            "attention_mask": {0: "batch", 1: "seq"},
+            "last_hidden_state": {0: "batch", 1: "seq"},
+        },
+        opset_version=OPSET,
+    )
+    if em.get_device() != "cpu":
+        transformer.to(em.get_device())
+
+def _export_image(path: Path) -> None:
+    import torch
+    import embedding_models as em
+
+    clip_model = em.get_clip()[0]
+    visual = clip_model.visual.cpu().eval()
+    dummy = torch.zeros(1, 3, em.CLIP_INPUT_SIZE, em.CLIP_INPUT_SIZE)
+    _onnx_export(
+        visual,
+        (dummy,),
+        str(path),
+        input_names=["pixel_values"],
+        output_names=["image_embeds"],
+        dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+        opset_version=OPSET,
+    )
+    if em.get_device() != "cpu":
+        visual.to(em.get_device())
+
+def model_path(kind: str, quantize: bool) -> Path:
+    """Export (and quantize) on first use; return the .onnx file for kind in {"text", "image"}."""
+    import embedding_models as em
+
+    name = em.TEXT_MODEL_NAME if kind == "text" else f"{em.CLIP_MODEL_NAME}-{em.CLIP_PRETRAINED}"
+    stem = name.replace("/", "__")
+    fp32 = ONNX_DIR / f"{stem}.fp32.onnx"
+    if not fp32.exists():
+        ONNX_DIR.mkdir(parents=True, exist_ok=True)
+        print(f"Exporting {kind} encoder to {fp32}...")
+        tmp = fp32.with_suffix(".tmp.onnx")
+        (_export_text if kind == "text" else _export_image)(tmp)
+        tmp.replace(fp32)
+    if not quantize:
+        return fp32
+
+    int8 = ONNX_DIR / f"{stem}.int8.onnx"
+    if not int8.exists():
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        print(f"Quantizing {kind} encoder to {int8}...")
+        tmp = int8.with_suffix(".tmp.onnx")
+        quantize_dynamic(str(fp32), str(tmp), weight_type=QuantType.QInt8)
+        tmp.replace(int8)
+    return int8
+
+def get_session(kind: str, quantize: bool, threads: int = 0):
+    """Cached CPU InferenceSession; threads=0 lets ONNX Runtime pick (one per physical core)."""
+    key = (kind, quantize, threads)
+    if key not in _SESSIONS:
+        with _SESSIONS_LOCK:
+            if key not in _SESSIONS:
+                import onnxruntime as ort
+                opts = ort.SessionOptions()
+                opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+                opts.intra_op_num_threads = threads
+                opts.inter_op_num_threads = 1
+                _SESSIONS[key] = ort.InferenceSession(
+                    str(model_path(kind, quantize)), opts, providers=["CPUExecutionProvider"]
+                )
+    return _SESSIONS[key]
+
+def encode_texts(texts: List[str], quantize: bool, threads: int = 0, batch_size: int = 64) -> np.ndarray:
+    """Mean-pooled, L2-normalised MiniLM embeddings, matching SentenceTransformer.encode."""
+    import embedding_models as em
+
+    tokenizer = em.get_tokenizer()
+    sess = get_session("text", quantize, threads)
+    out = np.zeros((len(texts), em.TEXT_DIM), dtype=np.float32)
+    for start in range(0, len(texts), batch_size):
+        part = texts[start:start + batch_size]
+        tok = tokenizer(
+            part, padding=True, truncation=True, max_length=em.TEXT_MAX_SEQ_LENGTH, return_tensors="np"
+        )
+        mask = tok["attention_mask"].astype(np.int64)
+        (hidden,) = sess.run(None, {"input_ids": tok["input_ids"].astype(np.int64), "attention_mask": mask})
+        m = mask[..., None].astype(np.float32)
+        pooled = (hidden * m).sum(axis=1) / np.clip(m.sum(axis=1), 1e-9, None)
+        out[start:start + len(part)] = pooled
+    n = np.linalg.norm(out, axis=1, keepdims=True) + 1e-12
+    return (out / n).astype(np.float32)
+
+def encode_image_tensors(pixel_values: np.ndarray, quantize: bool, threads: int = 0) -> np.ndarray:
+    """CLIP image embeddings (L2-normalised) for a preprocessed (N, 3, H, W) float32 batch."""
+    sess = get_session("image", quantize, threads)
+    (feats,) = sess.run(None, {"pixel_values": np.ascontiguousarray(pixel_values, dtype=np.float32)})
+    n = np.linalg.norm(feats, axis=1, keepdims=True) + 1e-12
+    return (feats / n).astype(np.float32)
+
+def cosine_agreement(reference: np.ndarray, candidate: np.ndarray) -> Dict[str, float]:
+    """Row-wise cosine between two sets of normalised vectors (zero rows ignored)."""
+    keep = np.any(reference, axis=1) & np.any(candidate, axis=1)
+    if not np.any(keep):
+        return {"min": float("nan"), "mean": float("nan")}
+    cos = np.sum(reference[keep] * candidate[keep], axis=1)
+    return {"min": float(cos.min()), "mean": float(cos.mean())}
@@ -0,0 +1,73 @@
+# payload_schema.py
+"""
+Declarative payload index schema of the Qdrant collections.
+
+Each field gets the index type its values and filters need: integer (match + range)
+for page and image sizes, bool for is_caption, keyword for IDs and tag arrays, and
+full-text for the chunk/caption text. site_ids is flagged as the tenant field, since
+most searches are scoped to one site; Qdrant co-locates each site's points on disk.
+Applied with VectorStore.ensure_payload_indexes, which creates missing indexes,
+replaces ones of the wrong type and checks the result against collection_info.
+"""
+from typing import Dict, Union
+
+from qdrant_client import models
+
+PayloadFieldSchema = Union[models.PayloadSchemaType, models.PayloadSchemaParams]
+
+KEYWORD = models.PayloadSchemaType.KEYWORD
+TENANT = models.KeywordIndexParams(type=models.KeywordIndexType.KEYWORD, is_tenant=True)
+BOOL = models.PayloadSchemaType.BOOL
+PAGE = models.IntegerIndexParams(type=models.IntegerIndexType.INTEGER, lookup=True, range=True)
+# Only ever filtered by range (e.g. width >= 800)
+SIZE = models.IntegerIndexParams(type=models.IntegerIndexType.INTEGER, lookup=False, range=True)
+FULL_TEXT = models.TextIndexParams(
+    type=models.TextIndexType.TEXT,
+    tokenizer=models.TokenizerType.WORD,
+    lowercase=True,
+    min_token_len=2,
+    max_token_len=40,
+)
+
+PAYLOAD_SCHEMAS: Dict[str, Dict[str, PayloadFieldSchema]] = {
+    "rag_text_chunks": {
+        "doc_id": KEYWORD,
+        "page": PAGE,
+        "is_caption": BOOL,
+        "figure_id": KEYWORD,
+        "section_path": KEYWORD,
+        "site_ids": TENANT,
+        "concept_ids": KEYWORD,
+        "license": KEYWORD,
+        "text": FULL_TEXT,
+    },
+    "media_assets": {
+        "media_id": KEYWORD,
+        "site_ids": TENANT,
+        "concept_ids": KEYWORD,
+        "license": KEYWORD,
+        "sensitivity": KEYWORD,
+        "asset_type": KEYWORD,
+        "parent_doc_id": KEYWORD,
+        "width": SIZE,
+        "height": SIZE,
+        "image_group": KEYWORD,
+        "caption_text": FULL_TEXT,
+    },
+}
+
+def schema_type(schema: PayloadFieldSchema) -> models.PayloadSchemaType:
+    """Index type of a field schema, as reported in CollectionInfo.payload_schema."""
+    if isinstance(schema, models.PayloadSchemaType):
+        return schema
+    return models.PayloadSchemaType(schema.type.value)
+
+def matches(info: models.PayloadIndexInfo, schema: PayloadFieldSchema) -> bool:
+    """True if an existing index has the wanted type and every parameter set in schema."""
+    if info.data_type != schema_type(schema):
+        return False
+    if isinstance(schema, models.PayloadSchemaType):
+        return True
+    wanted = schema.model_dump(mode="json", exclude_none=True)
+    actual = info.params.model_dump(mode="json", exclude_none=True) if info.params is not None else {}
+    return all(actual.get(k) == v for k, v in wanted.items())
@@ -1,46 +1,102 @@
 import argparse
 import json
+import multiprocessing as mp
 import os
 import re
 import shutil
+import signal
 import subprocess
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from multiprocessing.connection import wait as wait_connections
 from pathlib import Path
-from typing import List, Tuple, Dict
+from typing import Iterator, List, Tuple, Dict, Optional
 
+import utils
+
+
+# Bump when the bundle layout written by process_single_pdf changes
+BUNDLE_FORMAT_VERSION = 1
+BUNDLE_CACHE_FILE = ".bundle_cache.json"
 
 IMAGE_MD_PATTERN = re.compile(r'!\[(?P<alt>[^\]]*)\]\((?P<src>[^)]+)\)')
 TABLE_SEPARATOR_PATTERN = re.compile(
     r'^\s*\|?\s*:?-{3,}:?\s*(\|\s*:?-{3,}:?\s*)+\|?\s*$'
 )
 
-def run_cmd(cmd: List[str]) -> Tuple[int, str, str]:
-    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    out, err = proc.communicate()
-    return proc.returncode, out, err
+# Index into marker_cli_variants() of the CLI form that last succeeded in this process,
+# so later PDFs skip the variants that already failed.
+_WORKING_CLI: Optional[int] = None
+_WORKING_CLI_LOCK = threading.Lock()
 
-def run_marker_convert(pdf_path: Path, out_dir: Path) -> Path:
+# Long-lived in-process Marker converter (one per worker process, see init_marker_worker)
+_CONVERTER = None
+# Seconds an api worker may take to import Marker and load its models (first run downloads them)
+WORKER_STARTUP_TIMEOUT = 900.0
+
+def run_cmd(cmd: List[str], timeout: Optional[float] = None) -> Tuple[int, str, str]:
     """
-    Run Marker on a single PDF into out_dir.
-    Returns the path to the created Markdown file.
-    Tries several CLI variants for portability.
+    Run cmd and capture its output. On timeout the whole process group is killed
+    (Marker may spawn helpers) and TimeoutError is raised.
     """
-    out_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        proc = subprocess.Popen(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+            start_new_session=True,
+        )
+    except FileNotFoundError as e:
+        return 127, "", str(e)
+    try:
+        out, err = proc.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except (AttributeError, ProcessLookupError):
+            proc.kill()
+        proc.communicate()
+        raise TimeoutError(f"Command timed out after {timeout}s: {' '.join(cmd)}")
+    return proc.returncode, out, err
 
-    candidate_cmds = [
+def marker_cli_variants(pdf_path: Path, out_dir: Path) -> List[List[str]]:
+    return [
         ["marker", "convert", str(pdf_path), "--output-dir", str(out_dir)],
         ["marker", str(pdf_path), "--output-dir", str(out_dir)],
         ["python", "-m", "marker", "convert", str(pdf_path), "--output-dir", str(out_dir)],
         ["python3", "-m", "marker", "convert", str(pdf_path), "--output-dir", str(out_dir)],
     ]
 
+def newest_markdown(out_dir: Path) -> Optional[Path]:
+    # Find the newest .md in out_dir (Marker typically writes exactly one)
+    md_files = sorted(out_dir.rglob("*.md"), key=lambda p: p.stat().st_mtime, reverse=True)
+    return md_files[0] if md_files else None
+
+def run_marker_convert(pdf_path: Path, out_dir: Path, timeout: Optional[float] = None) -> Path:
+    """
+    Run Marker on a single PDF into out_dir.
+    Returns the path to the created Markdown file.
+    Tries several CLI variants for portability, starting with the one that worked last.
+    """
+    global _WORKING_CLI
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    candidate_cmds = marker_cli_variants(pdf_path, out_dir)
+    order = list(range(len(candidate_cmds)))
+    with _WORKING_CLI_LOCK:
+        known = _WORKING_CLI
+    if known is not None:
+        order.remove(known)
+        order.insert(0, known)
+
     last_err = ""
-    for cmd in candidate_cmds:
-        code, out, err = run_cmd(cmd)
+    for idx in order:
+        code, out, err = run_cmd(candidate_cmds[idx], timeout=timeout)
         if code == 0:
-            # Find the newest .md in out_dir (Marker typically writes exactly one)
-            md_files = sorted(out_dir.rglob("*.md"), key=lambda p: p.stat().st_mtime, reverse=True)
-            if md_files:
-                return md_files[0]
+            md_path = newest_markdown(out_dir)
+            if md_path:
+                with _WORKING_CLI_LOCK:
+                    _WORKING_CLI = idx
+                return md_path
             else:
                 last_err = f"Marker ran but no .md found in {out_dir}"
         else:
@@ -51,6 +107,29 @@ def run_marker_convert(pdf_path: Path, out_dir: Path) -> Path:
         "Check that 'marker' is installed (pip install marker-pdf) and on PATH."
     )
 
+def init_marker_worker() -> None:
+    """Load Marker's models once per worker process."""
+    global _CONVERTER
+    from marker.converters.pdf import PdfConverter
+    from marker.models import create_model_dict
+    _CONVERTER = PdfConverter(artifact_dict=create_model_dict())
+
+def run_marker_inprocess(pdf_path: Path, out_dir: Path) -> Path:
+    """
+    Convert with the worker's long-lived Marker converter (no per-PDF model load).
+    Timeouts are enforced by the parent, see run_api_pool.
+    """
+    from marker.output import save_output
+    if _CONVERTER is None:
+        init_marker_worker()
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rendered = _CONVERTER(str(pdf_path))
+    save_output(rendered, str(out_dir), pdf_path.stem)
+    md_path = out_dir / f"{pdf_path.stem}.md"
+    if not md_path.exists():
+        raise RuntimeError(f"Marker ran but no .md found in {out_dir}")
+    return md_path
+
 def is_table_block(lines: List[str], start_idx: int) -> Tuple[bool, int]:
     """
     Heuristically detect a GitHub-style Markdown table starting at start_idx.
@@ -192,13 +271,52 @@ def copy_images(images_meta: List[Dict], dest_dir: Path) -> List[str]:
             copied.append(str(target.resolve()))
     return copied
 
-def process_single_pdf(pdf_path: Path, out_root: Path) -> Dict:
+def marker_version() -> str:
+    try:
+        from importlib.metadata import version, PackageNotFoundError
+        return version("marker-pdf")
+    except Exception:
+        return "unknown"
+
+def bundle_cache_key(pdf_path: Path, backend: str) -> str:
+    """Content address of a bundle: PDF bytes + Marker version + conversion options."""
+    return utils.fingerprint(
+        utils.calculate_sha256(pdf_path), marker_version(), backend, BUNDLE_FORMAT_VERSION
+    )
+
+def load_cached_record(pdf_path: Path, out_root: Path, cache_key: str) -> Optional[Dict]:
+    """Return the stored record if the bundle was built from the same key and its files still exist."""
+    cache_file = out_root / pdf_path.stem / BUNDLE_CACHE_FILE
+    try:
+        cached = json.loads(cache_file.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    record = cached.get("record") or {}
+    if cached.get("key") != cache_key:
+        return None
+    if not all(record.get(k) and Path(record[k]).exists() for k in ("markdown", "text_only")):
+        return None
+    return record
+
+def process_single_pdf(
+    pdf_path: Path,
+    out_root: Path,
+    backend: str = "cli",
+    timeout: Optional[float] = None,
+    cache_key: Optional[str] = None,
+) -> Dict:
     pdf_stem = pdf_path.stem
     work_dir = out_root / pdf_stem
     work_dir.mkdir(parents=True, exist_ok=True)
+    # Stale derived outputs would otherwise linger (and images get _1, _2 suffixes)
+    for sub in ("tables", "images"):
+        shutil.rmtree(work_dir / sub, ignore_errors=True)
 
     # 1) Run Marker
-    md_path = run_marker_convert(pdf_path, work_dir)
+    if backend == "api":
+        md_path = run_marker_inprocess(pdf_path, work_dir)
+    else:
+        md_path = run_marker_convert(pdf_path, work_dir, timeout=timeout)
 
     # 2) Split MD into text/tables/images
     text_only, table_blocks, images_meta = split_md_text_tables_images(md_path)
@@ -239,14 +357,162 @@ def process_single_pdf(pdf_path: Path, out_root: Path) -> Dict:
         "num_tables": len(table_md_paths),
         "num_images": len(image_paths),
     }
+    if cache_key:
+        (work_dir / BUNDLE_CACHE_FILE).write_text(
+            json.dumps({"key": cache_key, "record": record}, ensure_ascii=False, indent=2),
+            encoding="utf-8",
+        )
     return record
 
+def merge_dataset_index(idx_path: Path, records: List[Dict]) -> List[Dict]:
+    """Merge records into an existing dataset_index.json by PDF path, dropping PDFs that no longer exist."""
+    merged: Dict[str, Dict] = {}
+    if idx_path.exists():
+        try:
+            for rec in json.loads(idx_path.read_text(encoding="utf-8")):
+                merged[rec["pdf"]] = rec
+        except (ValueError, KeyError, TypeError):
+            print(f"    ! Ignoring unreadable index {idx_path}")
+    for rec in records:
+        merged[rec["pdf"]] = rec
+    return [merged[k] for k in sorted(merged) if Path(k).exists()]
+
+def _api_worker(conn) -> None:
+    """api worker process: load Marker once, then convert (pdf, out_root, key) tasks until None."""
+    init_marker_worker()
+    conn.send(("ready", None))
+    while True:
+        task = conn.recv()
+        if task is None:
+            return
+        pdf, out_root, key = task
+        try:
+            conn.send(("ok", process_single_pdf(pdf, out_root, "api", cache_key=key)))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+def run_api_pool(
+    todo: List[Tuple[Path, str]],
+    out_root: Path,
+    workers: int,
+    timeout: Optional[float] = None,
+    startup_timeout: float = WORKER_STARTUP_TIMEOUT,
+) -> Iterator[Tuple[Path, Optional[Dict], Optional[str]]]:
+    """
+    Convert todo with the api backend in supervised worker processes, each keeping
+    Marker's models loaded. The deadline is enforced from here: native Marker/torch
+    code can't be interrupted from inside a worker, so a worker still busy after
+    timeout seconds (counted from when it got the PDF) is killed and replaced. A worker
+    not ready within startup_timeout is killed and not replaced; once no worker is
+    left, the remaining PDFs fail.
+    Yields (pdf, record, error) as PDFs finish; exactly one of record/error is set.
+    """
+    ctx = mp.get_context("spawn") # fresh interpreters: no forked torch state
+    pending = list(reversed(todo))
+    procs: Dict = {}   # connection -> worker process
+    busy: Dict = {}    # connection -> (pdf, deadline)
+    starting: Dict = {}  # connection -> startup deadline
+    idle: List = []
+
+    def start_worker() -> None:
+        parent, child = ctx.Pipe()
+        proc = ctx.Process(target=_api_worker, args=(child,), daemon=True)
+        proc.start()
+        child.close()
+        procs[parent] = proc
+        starting[parent] = time.monotonic() + startup_timeout
+
+    def retire(conn) -> None:
+        proc = procs.pop(conn)
+        if proc.is_alive():
+            proc.kill()
+        proc.join()
+        conn.close()
+        starting.pop(conn, None)
+        if conn in idle:
+            idle.remove(conn)
+
+    for _ in range(min(workers, len(todo))):
+        start_worker()
+    started = set()  # workers that loaded Marker successfully
+    try:
+        while pending or busy:
+            while idle and pending:
+                conn = idle.pop()
+                pdf, key = pending.pop()
+                conn.send((pdf, out_root, key))
+                busy[conn] = (pdf, time.monotonic() + timeout if timeout else float("inf"))
+            if not procs:
+                # Every worker died while loading Marker: nothing can convert the rest
+                for pdf, _ in reversed(pending):
+                    yield pdf, None, "Marker worker failed to start"
+                return
+
+            next_deadline = min([d for _, d in busy.values()] + list(starting.values()), default=float("inf"))
+            wait = None if next_deadline == float("inf") else max(0.0, next_deadline - time.monotonic())
+            for conn in wait_connections(list(procs), timeout=wait):
+                try:
+                    kind, value = conn.recv()
+                except (EOFError, OSError):
+                    proc = procs[conn]
+                    proc.join(timeout=1)
+                    code = proc.exitcode
+                    retire(conn)
+                    if conn in busy:
+                        pdf, _ = busy.pop(conn)
+                        yield pdf, None, f"worker exited (code {code})"
+                    if conn in started and pending:
+                        start_worker()
+                    continue
+                if kind == "ready":
+                    del starting[conn]
+                    started.add(conn)
+                    idle.append(conn)
+                    continue
+                pdf, _ = busy.pop(conn)
+                idle.append(conn)
+                yield (pdf, value, None) if kind == "ok" else (pdf, None, value)
+
+            now = time.monotonic()
+            for conn, deadline in list(starting.items()):
+                if now > deadline:
+                    print(f"    ! Marker worker not ready after {startup_timeout}s; killing it")
+                    retire(conn)
+            for conn, (pdf, deadline) in list(busy.items()):
+                if now > deadline:
+                    del busy[conn]
+                    retire(conn)
+                    yield pdf, None, f"timed out after {timeout}s (worker killed)"
+                    if pending:
+                        start_worker()
+    finally:
+        for conn in list(procs):
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+        for conn, proc in list(procs.items()):
+            proc.join(timeout=5)
+            retire(conn)
+
 def main():
     parser = argparse.ArgumentParser(description="Batch parse PDFs with Marker into text/tables/images.")
     parser.add_argument("--pdf_dir", type=str, default="pdf",
                         help="Folder containing PDF files.")
     parser.add_argument("--out_dir", type=str, default="parsed",
                         help="Output root folder.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of PDFs converted concurrently (default: 1).")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="Per-PDF timeout in seconds; a PDF exceeding it is killed and marked failed.")
+    parser.add_argument("--startup-timeout", type=float, default=WORKER_STARTUP_TIMEOUT,
+                        help="With --backend api, seconds a worker may take to load Marker before "
+                             f"it is killed (default: {WORKER_STARTUP_TIMEOUT:.0f}).")
+    parser.add_argument("--backend", type=str, choices=["cli", "api"], default="cli",
+                        help="'cli' runs the marker command per PDF; 'api' keeps Marker's models "
+                             "loaded in each worker process (requires marker-pdf importable).")
+    parser.add_argument("--force", action="store_true",
+                        help="Re-run Marker even for PDFs whose bundle is up to date.")
     args = parser.parse_args()
 
     pdf_dir = Path(args.pdf_dir)
@@ -259,20 +525,62 @@ def main():
         return
 
     index = []
+    t_start = time.perf_counter()
+
+    # Reuse bundles whose PDF hash, Marker version and options are unchanged
+    todo: List[Tuple[Path, str]] = []
     for pdf in pdfs:
-        print(f"[+] Processing: {pdf}")
-        try:
-            rec = process_single_pdf(pdf, out_root)
+        key = bundle_cache_key(pdf, args.backend)
+        rec = None if args.force else load_cached_record(pdf, out_root, key)
+        if rec is not None:
             index.append(rec)
-            print(f"    → OK: {rec['bundle_dir']}")
-        except Exception as e:
-            print(f"    ! Failed on {pdf.name}: {e}")
-
-    # Write dataset index
+        else:
+            todo.append((pdf, key))
+    print(f"[+] {len(pdfs) - len(todo)} PDFs unchanged (skipped), {len(todo)} to convert")
+
+    if args.workers <= 1 and args.backend == "cli":
+        for pdf, key in todo:
+            print(f"[+] Processing: {pdf}")
+            try:
+                rec = process_single_pdf(pdf, out_root, timeout=args.timeout, cache_key=key)
+                index.append(rec)
+                print(f"    → OK: {rec['bundle_dir']}")
+            except Exception as e:
+                print(f"    ! Failed on {pdf.name}: {e}")
+    elif todo and args.backend == "api":
+        print(f"[+] Processing {len(todo)} PDFs with {args.workers} api worker(s)")
+        for pdf, rec, err in run_api_pool(
+            todo, out_root, max(1, args.workers), args.timeout, args.startup_timeout
+        ):
+            if rec is not None:
+                index.append(rec)
+                print(f"    → OK: {pdf.name} → {rec['bundle_dir']}")
+            else:
+                print(f"    ! Failed on {pdf.name}: {err}")
+    elif todo:
+        # Threads are enough: each conversion runs in its own marker subprocess
+        print(f"[+] Processing {len(todo)} PDFs with {args.workers} {args.backend} worker(s)")
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+            futures: Dict[Future, Path] = {
+                pool.submit(process_single_pdf, pdf, out_root, args.backend, args.timeout, key): pdf
+                for pdf, key in todo
+            }
+            for fut in as_completed(futures):
+                pdf = futures[fut]
+                try:
+                    rec = fut.result()
+                    index.append(rec)
+                    print(f"    → OK: {pdf.name} → {rec['bundle_dir']}")
+                except Exception as e:
+                    print(f"    ! Failed on {pdf.name}: {e}")
+
+    # Merge into the dataset index
     idx_path = out_root / "dataset_index.json"
-    idx_path.write_text(json.dumps(index, ensure_ascii=False, indent=2), encoding="utf-8")
-    print(f"\nWrote index: {idx_path.resolve()}")
-    print(f"Done. {len(index)} PDFs processed successfully.")
+    merged = merge_dataset_index(idx_path, index)
+    idx_path.write_text(json.dumps(merged, ensure_ascii=False, indent=2), encoding="utf-8")
+    elapsed = time.perf_counter() - t_start
+    print(f"\nWrote index: {idx_path.resolve()} ({len(merged)} entries)")
+    print(f"Done. {len(index)} PDFs up to date ({len(index) - (len(pdfs) - len(todo))} converted) in {elapsed:.1f}s.")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,145 @@
+# query_cache.py
+"""
+Query-side caches for the retrieval path.
+
+CachedQueryEncoder memoises query embeddings by normalised text; ResultCache memoises
+VectorStore search results by (collection, vector name, query, filter, limit, ...).
+VectorStore bumps a per-collection generation whenever its upsert_points/delete_points
+(or a BackgroundUpserter) writes to a collection, which retires every cached result
+for it. Writes made by other processes are only seen after ttl seconds.
+"""
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence
+
+import numpy as np
+
+class LRUTTLCache:
+    """Thread-safe LRU cache with an optional time-to-live per entry."""
+
+    def __init__(self, max_entries: int = 10_000, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and (self.ttl is None or time.monotonic() - item[0] < self.ttl):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> str:
+        return f"{self.hits} hits, {self.misses} misses ({self.hit_rate:.1%} hit rate), {len(self)} entries"
+
+def normalize_query(text: str) -> str:
+    """Case/whitespace/Unicode-form folding; the MiniLM and CLIP tokenizers are uncased."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip().lower()
+
+class CachedQueryEncoder:
+    """
+    Wraps a batch encoder (texts -> (N, D) ndarray), e.g. embedding_models.embed_texts,
+    so repeated questions are embedded once. Returned vectors are read-only.
+    """
+
+    def __init__(
+        self,
+        encode: Callable[[List[str]], np.ndarray],
+        max_entries: int = 10_000,
+        ttl: Optional[float] = None,
+    ):
+        self.encode = encode
+        self.cache = LRUTTLCache(max_entries, ttl)
+
+    def embed_many(self, texts: Sequence[str]) -> np.ndarray:
+        keys = [normalize_query(t) for t in texts]
+        found = [self.cache.get(k) for k in keys]
+        missing = list(dict.fromkeys(k for k, v in zip(keys, found) if v is None))
+        if missing:
+            computed = np.asarray(self.encode(missing), dtype=np.float32)
+            fresh = dict(zip(missing, computed))
+            for k, vec in fresh.items():
+                vec.setflags(write=False)
+                self.cache.put(k, vec)
+            found = [v if v is not None else fresh[k] for k, v in zip(keys, found)]
+        return np.stack(found) if found else np.empty((0, 0), dtype=np.float32)
+
+    def __call__(self, text: str) -> np.ndarray:
+        return self.embed_many([text])[0]
+
+def text_query_encoder(max_entries: int = 10_000, ttl: Optional[float] = None) -> CachedQueryEncoder:
+    """CachedQueryEncoder over the MiniLM text model used for rag_text_chunks and captions."""
+    import embedding_models as em
+    return CachedQueryEncoder(em.embed_texts, max_entries, ttl)
+
+def _fingerprint_value(value: Any, h) -> None:
+    if isinstance(value, np.ndarray):
+        h.update(np.ascontiguousarray(value, dtype=np.float32).tobytes())
+    elif isinstance(value, (list, tuple)) and value and isinstance(value[0], float):
+        h.update(np.asarray(value, dtype=np.float32).tobytes())
+    elif isinstance(value, dict):
+        for k in sorted(value, key=str):
+            h.update(repr(k).encode("utf-8"))
+            _fingerprint_value(value[k], h)
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            _fingerprint_value(v, h)
+    elif hasattr(value, "model_dump_json"):
+        h.update(value.model_dump_json(exclude_none=True).encode("utf-8")) # Filters, SparseVectors
+    else:
+        h.update(repr(value).encode("utf-8"))
+    h.update(b"\x1f")
+
+class ResultCache(LRUTTLCache):
+    """LRU/TTL cache of search results, retired per collection by bump()."""
+
+    def __init__(self, max_entries: int = 10_000, ttl: Optional[float] = 300.0):
+        super().__init__(max_entries, ttl)
+        self._generations: Dict[str, int] = {}
+        self.invalidations = 0
+
+    def bump(self, collection_name: str) -> None:
+        """Called after writes to a collection; older entries can no longer be hit."""
+        with self._lock:
+            self._generations[collection_name] = self._generations.get(collection_name, 0) + 1
+            self.invalidations += 1
+
+    def key(self, collection_name: str, kind: str, *parts: Any) -> tuple:
+        h = hashlib.blake2b(digest_size=16)
+        for part in parts:
+            _fingerprint_value(part, h)
+        return (collection_name, self._generations.get(collection_name, 0), kind, h.hexdigest())
+
+    def stats(self) -> str:
+        return f"{super().stats()}, {self.invalidations} invalidations"
@@ -0,0 +1,79 @@
+# sparse_encoder.py
+"""
+Local BM25-style sparse vectors for lexical matching in Qdrant.
+
+Documents get BM25 term-frequency weights (k1/b saturation against a fixed average
+chunk length); the IDF part is applied server-side by the collection's sparse vector
+config (Modifier.IDF), so vectors never need recomputing as the corpus grows. Terms
+are hashed to 32-bit indices, which avoids shipping a vocabulary.
+"""
+import functools
+import hashlib
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, List
+
+from qdrant_client import models
+
+SPARSE_VECTOR_NAME = "bm25"
+SPARSE_VERSION = "bm25-hash32-v1"
+# Roughly the token count of a 1000-character chunk
+AVG_DOC_TOKENS = 150
+# Memoized token hashes; bounded so a long-running query encoder doesn't grow without limit
+TERM_ID_CACHE_SIZE = 1 << 16
+
+TOKEN_RE = re.compile(r"[^\W_]+")
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have in into is it its of on or that the their
+there these this to was were which with not no can may also than then they been such
+""".split())
+
+def sparse_vectors_config() -> Dict[str, models.SparseVectorParams]:
+    """Collection config for the sparse vector written by BM25SparseEncoder."""
+    return {SPARSE_VECTOR_NAME: models.SparseVectorParams(modifier=models.Modifier.IDF)}
+
+@functools.lru_cache(maxsize=TERM_ID_CACHE_SIZE)
+def _hash_term(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=4).digest(), "little")
+
+class BM25SparseEncoder:
+    """Tokenize, hash and weight texts into qdrant SparseVectors."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, avg_doc_tokens: float = AVG_DOC_TOKENS):
+        self.k1 = k1
+        self.b = b
+        self.avg_doc_tokens = avg_doc_tokens
+
+    @staticmethod
+    def tokenize(text: str) -> List[str]:
+        """Lowercased, accent-folded word tokens without stopwords or single characters."""
+        folded = text.lower()
+        if not folded.isascii():
+            folded = unicodedata.normalize("NFKD", folded)
+            folded = "".join(ch for ch in folded if not unicodedata.combining(ch))
+        return [t for t in TOKEN_RE.findall(folded) if len(t) > 1 and t not in STOPWORDS]
+
+    def term_id(self, token: str) -> int:
+        return _hash_term(token)
+
+    def _vector(self, weights: Dict[int, float]) -> models.SparseVector:
+        indices = sorted(weights)
+        return models.SparseVector(indices=indices, values=[weights[i] for i in indices])
+
+    def encode_document(self, text: str) -> models.SparseVector:
+        tokens = self.tokenize(text)
+        norm = self.k1 * (1 - self.b + self.b * len(tokens) / self.avg_doc_tokens)
+        weights: Dict[int, float] = {}
+        for token, tf in Counter(tokens).items():
+            tid = self.term_id(token)
+            # Hash collisions just add up
+            weights[tid] = weights.get(tid, 0.0) + tf * (self.k1 + 1) / (tf + norm)
+        return self._vector(weights)
+
+    def encode_documents(self, texts: List[str]) -> List[models.SparseVector]:
+        return [self.encode_document(t) for t in texts]
+
+    def encode_query(self, text: str) -> models.SparseVector:
+        """Each distinct query term weighs 1; the server multiplies in its IDF."""
+        return self._vector({self.term_id(t): 1.0 for t in self.tokenize(text)})
@@ -0,0 +1,134 @@
+# structure_splitter.py
+"""
+Structure-aware splitting of Marker markdown.
+
+Uses the markdown headings, image references and figure/table captions together with
+Marker's *_meta.json table of contents (heading title -> page_id) to emit chunks that
+carry their page, section path, figure ID and caption flag.
+"""
+import json
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.*)$")
+# Marker names extracted images _page_<page_id>_<BlockType>_<n>.<ext>
+IMAGE_RE = re.compile(r"!\[[^\]]*\]\(([^)\s]*?_page_(\d+)_[A-Za-z]+_\d+\.[A-Za-z0-9]+)\)")
+CAPTION_RE = re.compile(r"^[*_\s]*(Figure|Fig\.|Table|Plate)\s*(\d+[A-Za-z]?)\b", re.IGNORECASE)
+
+def _clean_title(title: str) -> str:
+    return re.sub(r"\s+", " ", title.replace("*", "").replace("_", " ")).strip()
+
+def _norm(title: str) -> str:
+    return re.sub(r"[^0-9a-z]+", "", _clean_title(title).lower())
+
+def load_toc_pages(meta_path: Path) -> List[Tuple[str, int]]:
+    """[(normalised heading title, page_id)] from a Marker *_meta.json, in document order."""
+    if not meta_path.exists():
+        return []
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    return [
+        (_norm(entry.get("title") or ""), int(entry["page_id"]))
+        for entry in meta.get("table_of_contents") or []
+        if entry.get("page_id") is not None
+    ]
+
+class MarkdownStructureSplitter:
+    """
+    Split Marker markdown into chunk dicts: {"text", "page", "section_path", "figure_id",
+    "is_caption"}. Pages are 1-based. Body text is packed up to chunk_size characters
+    within one section and page; captions become their own chunks.
+    """
+
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+        self.chunk_size = chunk_size
+        self._fallback = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            separators=["\n\n", "\n", " ", ""],
+        )
+
+    @staticmethod
+    def _blocks(text: str) -> List[str]:
+        return [b.strip() for b in re.split(r"\n\s*\n", text) if b.strip()]
+
+    @staticmethod
+    def _figure_id(doc_id: str, kind: str, number: str) -> str:
+        kind = "Figure" if kind.lower().startswith("fig") else kind.capitalize()
+        return f"{doc_id}/{kind}_{number}"
+
+    def split(self, text: str, doc_id: str, toc: List[Tuple[str, int]]) -> List[Dict[str, Any]]:
+        blocks = self._blocks(text)
+        chunks: List[Dict[str, Any]] = []
+        sections: List[Tuple[int, str]] = []
+        page = 0
+        toc_pos = 0
+        buf: List[str] = []
+        buf_page = 0
+
+        def flush() -> None:
+            if not buf:
+                return
+            body = "\n\n".join(buf)
+            parts = [body] if len(body) <= self.chunk_size else self._fallback.split_text(body)
+            for part in parts:
+                chunks.append({
+                    "text": part,
+                    "page": buf_page + 1,
+                    "section_path": [title for _, title in sections],
+                    "figure_id": None,
+                    "is_caption": False,
+                })
+            buf.clear()
+
+        # Image references, by block index, for attaching images to nearby captions
+        images = {i: m for i, b in enumerate(blocks) for m in [IMAGE_RE.search(b)] if m}
+
+        for i, block in enumerate(blocks):
+            heading = HEADING_RE.match(block)
+            if heading and "\n" not in block:
+                flush()
+                level, title = len(heading.group(1)), _clean_title(heading.group(2))
+                key = _norm(title)
+                for j in range(toc_pos, len(toc)):
+                    if toc[j][0] == key:
+                        page, toc_pos = toc[j][1], j + 1
+                        break
+                while sections and sections[-1][0] >= level:
+                    sections.pop()
+                sections.append((level, title))
+                continue
+
+            if i in images:
+                flush()
+                page = int(images[i].group(2))
+                continue
+
+            caption = CAPTION_RE.match(block)
+            if caption:
+                flush()
+                near = [j for j in (i - 1, i - 2, i + 1, i + 2) if j in images]
+                cap_page = int(images[near[0]].group(2)) if near else page
+                record = {
+                    "text": block,
+                    "page": cap_page + 1,
+                    "section_path": [title for _, title in sections],
+                    "figure_id": self._figure_id(doc_id, caption.group(1), caption.group(2)),
+                    "is_caption": True,
+                }
+                if near:
+                    record["image_ref"] = Path(images[near[0]].group(1)).name
+                chunks.append(record)
+                continue
+
+            if buf and (page != buf_page or len("\n\n".join(buf)) + len(block) + 2 > self.chunk_size):
+                flush()
+            if not buf:
+                buf_page = page
+            buf.append(block)
+
+        flush()
+        return chunks
@@ -0,0 +1,59 @@
+# test_incremental.py
+"""Incremental ingest runs against an in-memory Qdrant, with stub embedding functions."""
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+pytest.importorskip("qdrant_client")
+from qdrant_client import QdrantClient
+
+import embedding_models as em
+import ingest
+from vector_store import VectorStore
+
+def _fake_images(paths, batch_size, cache=None):
+    for start in range(0, len(paths), batch_size):
+        yield np.random.rand(len(paths[start:start + batch_size]), em.IMG_DIM).astype(np.float32)
+
+@pytest.fixture
+def run_ingest(tmp_path, monkeypatch):
+    articles = tmp_path / "articles"
+    doc = articles / "DOC_paper_00"
+    doc.mkdir(parents=True)
+    with open(doc / "DOC_paper_00_chunks.jsonl", "w", encoding="utf-8") as f:
+        for i in range(5):
+            f.write(json.dumps({"doc_id": "DOC_paper_00", "chunk_id": f"DOC_paper_00_{i}", "text": f"text {i}"}) + "\n")
+    (tmp_path / "images").mkdir()
+
+    client = QdrantClient(":memory:")
+    monkeypatch.setattr(em, "embed_texts", lambda texts, cache=None: np.random.rand(len(texts), em.TEXT_DIM).astype(np.float32))
+    monkeypatch.setattr(em, "iter_image_embeddings", _fake_images)
+    monkeypatch.setattr(ingest, "ARTICLES_ROOT", articles)
+    monkeypatch.setattr(ingest, "IMAGES_DIR", str(tmp_path / "images"))
+    monkeypatch.setattr(ingest, "MEDIA_REGISTRY_CSV", str(tmp_path / "media_registry.csv"))
+    monkeypatch.setattr(ingest, "VectorStore", lambda url=None: VectorStore(client=client))
+    # Local mode does not report payload indexes
+    monkeypatch.setattr(VectorStore, "check_payload_indexes", lambda self, *a, **k: [])
+
+    def run(*flags):
+        argv = ["ingest.py", "--no-embedding-cache", "--workers", "1", "--upsert-parallelism", "1",
+                "--manifest", str(tmp_path / "manifest.json"), *flags]
+        monkeypatch.setattr(sys, "argv", argv)
+        ingest.main()
+        vs = VectorStore(client=client)
+        collections = sorted(c.name for c in client.get_collections().collections)
+        return collections, {a: vs.resolve_alias(a) for a in ("rag_text_chunks", "media_assets")}
+
+    return run
+
+def test_incremental_with_no_images_keeps_serving_version(run_ingest):
+    collections, aliases = run_ingest("--incremental", "--blue-green")
+    assert aliases["media_assets"] != "media_assets"
+
+    for _ in range(2):
+        assert run_ingest("--incremental") == (collections, aliases)
@@ -2,8 +2,10 @@
 import csv
 import hashlib
 import json
+import time
+from itertools import islice
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Iterable, Iterator
 
 def find_liacara_root(start_path: Optional[Path] = None) -> Path:
     """
@@ -31,29 +33,80 @@ def find_liacara_root(start_path: Optional[Path] = None) -> Path:
         f"Please ensure the LIACARA folder exists in the project structure."
     )
 
-def calculate_sha256(file_path: Path) -> str:
+def calculate_sha256(file_path: Path, block_size: int = 1 << 20) -> str:
     """Calculate SHA256 checksum of a file."""
     sha256_hash = hashlib.sha256()
     with open(file_path, "rb") as f:
-        for byte_block in iter(lambda: f.read(4096), b""):
+        for byte_block in iter(lambda: f.read(block_size), b""):
             sha256_hash.update(byte_block)
     return sha256_hash.hexdigest()
 
+def fingerprint(*parts: Any) -> str:
+    """SHA256 over the string form of parts; used to detect changed chunks/media between runs."""
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(str(part if part is not None else "").encode("utf-8"))
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+def canonical_json(record: Dict[str, Any]) -> str:
+    """Key-order independent JSON of a record, for fingerprinting its whole payload."""
+    return json.dumps(record, sort_keys=True, ensure_ascii=False, default=str)
+
+def load_json_manifest(path: Path) -> Dict[str, Any]:
+    """Load a JSON manifest, returning {} if it does not exist yet."""
+    path = Path(path)
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_json_manifest(path: Path, manifest: Dict[str, Any]) -> None:
+    """Write a JSON manifest atomically (temp file + rename)."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    tmp.replace(path)
+
 def extract_doc_id_from_path(md_path: Path) -> str:
     """Extract doc_id from markdown file path (e.g., DOC_paper_01.md -> DOC_paper_01)."""
     return md_path.stem
 
-def read_jsonl_from_articles_root(articles_root: Path):
-    """Read all DOC_paper_*_chunks.jsonl files from DOC_paper_* directories."""
-    for doc_dir in sorted(articles_root.glob("DOC_paper_*")):
-        if not doc_dir.is_dir():
-            continue
+def iter_doc_dirs(articles_root: Path) -> List[Path]:
+    """All DOC_paper_* directories under articles_root, sorted."""
+    return [d for d in sorted(articles_root.glob("DOC_paper_*")) if d.is_dir()]
+
+# First line of a chunks JSONL written by chunker.py: {"_header": {...}}
+CHUNKS_HEADER_KEY = "_header"
+
+def read_chunks_header(chunks_file: Path) -> Optional[Dict[str, Any]]:
+    """Return the header record of a chunks JSONL file, or None if absent/unreadable."""
+    try:
+        with open(chunks_file, "r", encoding="utf-8") as f:
+            first = json.loads(f.readline() or "null")
+    except (OSError, ValueError):
+        return None
+    if isinstance(first, dict) and isinstance(first.get(CHUNKS_HEADER_KEY), dict):
+        return first[CHUNKS_HEADER_KEY]
+    return None
+
+def read_jsonl_from_doc_dirs(doc_dirs: Iterable[Path]):
+    """Read the DOC_paper_*_chunks.jsonl file of each given document directory."""
+    for doc_dir in doc_dirs:
         chunks_file = doc_dir / f"{doc_dir.name}_chunks.jsonl"
         if chunks_file.exists():
             with open(chunks_file, "r", encoding="utf-8") as f:
                 for line in f:
                     if line.strip():
-                        yield json.loads(line)
+                        row = json.loads(line)
+                        if CHUNKS_HEADER_KEY not in row:
+                            yield row
+
+def read_jsonl_from_articles_root(articles_root: Path):
+    """Read all DOC_paper_*_chunks.jsonl files from DOC_paper_* directories."""
+    yield from read_jsonl_from_doc_dirs(iter_doc_dirs(articles_root))
 
 def list_images(root: str) -> List[Path]:
     """Finds all common image files recursively."""
@@ -118,3 +171,50 @@ def to_int(x):
         return int(x) if x not in (None, "") else None
     except (ValueError, TypeError):
         return None
+
+def batched(iterable: Iterable[Any], n: int) -> Iterator[List[Any]]:
+    """Yield successive lists of at most n items from iterable."""
+    it = iter(iterable)
+    while True:
+        batch = list(islice(it, n))
+        if not batch:
+            return
+        yield batch
+
+class StageStats:
+    """Accumulates row counts and wall time per pipeline stage (read/embed/upsert)."""
+
+    def __init__(self):
+        self.rows: Dict[str, int] = {}
+        self.seconds: Dict[str, float] = {}
+
+    def add(self, stage: str, rows: int, seconds: float) -> None:
+        self.rows[stage] = self.rows.get(stage, 0) + rows
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+
+    def timed_iter(self, iterable: Iterable[Any], stage: str) -> Iterator[Any]:
+        """Wrap an iterator, charging the time spent producing each item to stage."""
+        it = iter(iterable)
+        while True:
+            t0 = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                self.add(stage, 0, time.perf_counter() - t0)
+                return
+            self.add(stage, 1, time.perf_counter() - t0)
+            yield item
+
+    def merge(self, other: "StageStats") -> None:
+        for stage in other.rows:
+            self.add(stage, other.rows[stage], other.seconds[stage])
+
+    def rate(self, stage: str) -> float:
+        secs = self.seconds.get(stage, 0.0)
+        return self.rows.get(stage, 0) / secs if secs > 0 else 0.0
+
+    def summary(self) -> str:
+        return ", ".join(
+            f"{stage}: {self.rows[stage]} rows in {self.seconds[stage]:.1f}s ({self.rate(stage):.1f} rows/s)"
+            for stage in self.rows
+        )
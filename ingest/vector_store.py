@@ -1,11 +1,53 @@
 # vector_store.py
 from __future__ import annotations
-from typing import Dict, List, Iterable, Optional, Union, Sequence, Any, Tuple
+import random
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Iterable, Iterator, Mapping, Optional, Union, Sequence, Any, Tuple, TypeVar
+import numpy as np
 from qdrant_client import QdrantClient, models
+from qdrant_client.http.exceptions import ResponseHandlingException, UnexpectedResponse
 from dataclasses import dataclass
 from itertools import islice, repeat, zip_longest
+from query_cache import ResultCache
+from payload_schema import PayloadFieldSchema, matches as schema_matches
+from collection_profiles import profile_of
 
 DistanceLike = Union[str, models.Distance]
+PointId = Union[int, str]
+
+# Qdrant's default optimizers.indexing_threshold (KB), restored after a bulk load if none was recorded
+DEFAULT_INDEXING_THRESHOLD = 10_000
+
+# Seconds the alias -> collection map (used for result cache keys) and the search
+# params detected from collection profiles are trusted
+ALIAS_MAP_TTL = 10.0
+
+# Fixed namespace so the same key always maps to the same point id, on any machine.
+POINT_ID_NAMESPACE = uuid.UUID("6f1c2b0e-4a57-5d1e-9c3b-6c1a7a2f0e11")
+
+def stable_point_id(key: str) -> str:
+    """Deterministic UUIDv5 point id for a business key such as a chunk_id or media_id."""
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, str(key)))
+
+def _to_point_id(pid: Union[PointId, uuid.UUID]) -> PointId:
+    """
+    Qdrant accepts unsigned ints or UUID strings. Those pass through unchanged;
+    any other string key is mapped to its stable UUIDv5.
+    """
+    if isinstance(pid, uuid.UUID):
+        return str(pid)
+    if isinstance(pid, int):
+        if pid < 0:
+            raise ValueError(f"Point ids must be unsigned, got {pid}")
+        return pid
+    try:
+        return str(uuid.UUID(str(pid)))
+    except ValueError:
+        return stable_point_id(pid)
 
 def _to_distance(d: DistanceLike) -> models.Distance:
     if isinstance(d, models.Distance):
@@ -19,6 +61,86 @@ def _to_distance(d: DistanceLike) -> models.Distance:
         return models.Distance.EUCLID
     raise ValueError(f"Unsupported distance: {d}")
 
+T = TypeVar("T")
+
+# Vectors: per-point lists/dicts, or a (N, D) float32 array / {name: (N, D) array} for the columnar path
+VectorsLike = Union[Iterable[Union[List[float], Dict[str, List[float]]]], np.ndarray, Mapping[str, np.ndarray]]
+# Payloads: one dict per point, or columns {field: values}
+PayloadsLike = Union[Iterable[Optional[Dict[str, Any]]], Mapping[str, Sequence[Any]]]
+UpsertBatch = Union[List[models.PointStruct], "ArrayBatch"]
+_TRANSIENT_STATUS = {408, 429, 500, 502, 503, 504}
+
+def _is_transient(exc: BaseException) -> bool:
+    """Errors worth retrying: timeouts, dropped connections, overload and 5xx responses."""
+    if isinstance(exc, UnexpectedResponse):
+        return exc.status_code in _TRANSIENT_STATUS
+    return isinstance(exc, (ResponseHandlingException, ConnectionError, TimeoutError))
+
+def with_retry(fn: Callable[[], T], max_retries: int = 5, backoff: float = 0.5) -> T:
+    """Call fn, retrying transient failures with jittered exponential backoff."""
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except Exception as e:
+            if attempt >= max_retries or not _is_transient(e):
+                raise
+            time.sleep(backoff * (2 ** attempt) * (0.5 + random.random()))
+            attempt += 1
+
+def _as_query(q: Any) -> Any:
+    """Query vectors as qdrant accepts them: lists of floats or SparseVector."""
+    return q.tolist() if isinstance(q, np.ndarray) else q
+
+def _is_sparse_column(values: Any) -> bool:
+    return isinstance(values, Sequence) and bool(values) and isinstance(values[0], models.SparseVector)
+
+def _is_array_vectors(vectors: Any) -> bool:
+    if isinstance(vectors, np.ndarray):
+        return True
+    return isinstance(vectors, Mapping) and bool(vectors) and all(
+        isinstance(v, np.ndarray) or _is_sparse_column(v) for v in vectors.values()
+    ) and any(isinstance(v, np.ndarray) for v in vectors.values())
+
+def _payload_rows(payloads: Optional[PayloadsLike], start: int, stop: int) -> Optional[List[Dict[str, Any]]]:
+    """Rows [start, stop) of a columnar payload batch; None values are left out."""
+    if payloads is None:
+        return None
+    return [
+        {k: col[i] for k, col in payloads.items() if col[i] is not None}
+        for i in range(start, stop)
+    ]
+
+@dataclass(frozen=True)
+class ArrayBatch:
+    """
+    One upsert batch held as array views. Conversion to a models.Batch (one bulk
+    tolist per vector name) is deferred until send time, so it runs on the upsert
+    worker instead of allocating per-point structures in the encoder loop.
+    Sparse vectors ride along as lists of models.SparseVector.
+    """
+    ids: List[PointId]
+    vectors: Union[np.ndarray, Dict[str, Union[np.ndarray, List[models.SparseVector]]]]
+    payloads: Optional[List[Dict[str, Any]]]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def to_batch(self) -> models.Batch:
+        if isinstance(self.vectors, np.ndarray):
+            vecs: Any = self.vectors.tolist()
+        else:
+            vecs = {
+                name: arr.tolist() if isinstance(arr, np.ndarray) else list(arr)
+                for name, arr in self.vectors.items()
+            }
+        # Arrays are already well-typed; skip pydantic re-validating every float
+        construct = getattr(models.Batch, "model_construct", None) or models.Batch.construct  # pydantic v2 / v1
+        return construct(ids=self.ids, vectors=vecs, payloads=self.payloads)
+
+def _as_upsert_points(batch: UpsertBatch) -> Union[List[models.PointStruct], models.Batch]:
+    return batch.to_batch() if isinstance(batch, ArrayBatch) else batch
+
 @dataclass(frozen=True)
 class VectorSpace:
     """Definition for one vector space."""
@@ -31,6 +153,9 @@ class VectorStore:
       - a single unnamed vector (classic), or
       - multiple named vectors (multimodal).
     Also handles: payload indexes, upserts, search, delete, info, etc.
+    With a result_cache, search results are memoised until this store writes to
+    the collection again (or the cache's TTL expires). Results and writes are keyed
+    by physical collection, so searches through an alias see writes to its target.
     """
 
     def __init__(
@@ -39,8 +164,31 @@ class VectorStore:
         url: Optional[str] = "http://localhost:6333",
         api_key: Optional[str] = None,
         timeout: Optional[float] = None,
+        result_cache: Optional[ResultCache] = None,
     ):
         self.client = client or QdrantClient(url=url, api_key=api_key, timeout=timeout)
+        self.result_cache = result_cache
+        # Per-collection overrides for dense searches (hnsw_ef, quantization rescoring); collections
+        # not listed use the search_params of their profile, see collection_profiles
+        self.search_params: Dict[str, models.SearchParams] = {}
+        self._profile_params: Dict[str, Optional[models.SearchParams]] = {}
+        # indexing_threshold of collections in bulk-load mode, restored by end_bulk_load
+        self._bulk_thresholds: Dict[str, Optional[int]] = {}
+        self._alias_map: Dict[str, str] = {}
+        self._alias_map_time = float("-inf")
+
+    def _physical(self, collection_name: str) -> str:
+        """Collection behind an alias, from a map refreshed every ALIAS_MAP_TTL seconds."""
+        if time.monotonic() - self._alias_map_time > ALIAS_MAP_TTL:
+            self._alias_map = {a.alias_name: a.collection_name for a in self.client.get_aliases().aliases}
+            self._alias_map_time = time.monotonic()
+            self._profile_params.clear()
+        return self._alias_map.get(collection_name, collection_name)
+
+    def _touched(self, collection_name: str) -> None:
+        """Retire cached results after a write to collection_name (or the collection it aliases)."""
+        if self.result_cache is not None:
+            self.result_cache.bump(self._physical(collection_name))
 
     # ---------- COLLECTION CREATION ----------
 
@@ -59,6 +207,8 @@ class VectorStore:
         shard_number: Optional[int] = None,
         replication_factor: Optional[int] = None,
         write_consistency_factor: Optional[int] = None,
+        sparse_vectors: Optional[Dict[str, models.SparseVectorParams]] = None,
+        on_disk_vectors: Optional[bool] = None,
         force: bool = False,
         strict: bool = True,
     ) -> None:
@@ -66,13 +216,15 @@ class VectorStore:
         Create a collection. If it exists:
           - force=True  -> recreate (drops data!)
           - force=False -> no-op
+        sparse_vectors adds named sparse vectors, e.g. {"bm25": SparseVectorParams(modifier=IDF)}.
+        on_disk_vectors keeps the original dense vectors memory-mapped instead of in RAM.
         """
         exists = self.client.collection_exists(collection_name)
         
         if exists and not force:
             return  # Collection exists, do nothing
 
-        vectors_config = self._build_vectors_config(vectors, strict=strict)
+        vectors_config = self._build_vectors_config(vectors, strict=strict, on_disk=on_disk_vectors)
 
         # Combine all keyword arguments for the client call
         common_args = {
@@ -85,24 +237,27 @@ class VectorStore:
             "shard_number": shard_number,
             "replication_factor": replication_factor,
             "write_consistency_factor": write_consistency_factor,
+            "sparse_vectors_config": sparse_vectors,
         }
 
         if exists and force:
             self.client.recreate_collection(**common_args)
         elif not exists:
             self.client.create_collection(**common_args)
+        self._touched(collection_name)
 
     def _build_vectors_config(
         self,
         vectors: Union[Tuple[int, DistanceLike], Dict[str, Union[Tuple[int, DistanceLike], VectorSpace]]],
         strict: bool = True,
+        on_disk: Optional[bool] = None,
     ) -> Union[models.VectorParams, Dict[str, models.VectorParams]]:
         # Single-vector path
         if isinstance(vectors, tuple):
             size, dist = vectors
             if strict:
                 assert isinstance(size, int) and size > 0, "size must be positive int"
-            return models.VectorParams(size=size, distance=_to_distance(dist))
+            return models.VectorParams(size=size, distance=_to_distance(dist), on_disk=on_disk)
 
         # Named-vectors path
         cfg: Dict[str, models.VectorParams] = {}
@@ -111,9 +266,9 @@ class VectorStore:
                 assert isinstance(name, str) and name, "vector name must be non-empty str"
             if isinstance(spec, tuple):
                 size, dist = spec
-                cfg[name] = models.VectorParams(size=int(size), distance=_to_distance(dist))
+                cfg[name] = models.VectorParams(size=int(size), distance=_to_distance(dist), on_disk=on_disk)
             elif isinstance(spec, VectorSpace):
-                cfg[name] = models.VectorParams(size=int(spec.size), distance=spec.distance)
+                cfg[name] = models.VectorParams(size=int(spec.size), distance=spec.distance, on_disk=on_disk)
             else:
                 raise TypeError(f"Unexpected vector spec for '{name}': {type(spec)}")
         if strict:
@@ -123,36 +278,214 @@ class VectorStore:
                 assert vp.size > 0, f"size must be >0 for '{name}'"
         return cfg
 
+    def update_collection_config(
+        self,
+        collection_name: str,
+        *,
+        hnsw_config: Optional[models.HnswConfigDiff] = None,
+        optimizers_config: Optional[models.OptimizersConfigDiff] = None,
+        quantization_config: Optional[models.QuantizationConfig] = None,
+        on_disk_vectors: Optional[bool] = None,
+    ) -> None:
+        """
+        Change index/storage settings of an existing collection in place; Qdrant
+        rebuilds the affected segments in the background. quantization_config=None
+        disables quantization.
+        """
+        vectors_config = None
+        if on_disk_vectors is not None:
+            names = self.collection_info(collection_name).config.params.vectors
+            names = list(names) if isinstance(names, dict) else [""]
+            vectors_config = {n: models.VectorParamsDiff(on_disk=on_disk_vectors) for n in names}
+        self.client.update_collection(
+            collection_name=collection_name,
+            hnsw_config=hnsw_config,
+            optimizers_config=optimizers_config,
+            quantization_config=quantization_config or models.Disabled.DISABLED,
+            vectors_config=vectors_config,
+        )
+        self._profile_params.pop(self._physical(collection_name), None)
+        self._touched(collection_name)
+
+    # ---------- ALIASES / BLUE-GREEN VERSIONS ----------
+
+    @staticmethod
+    def versioned_name(alias: str, version: Optional[str] = None) -> str:
+        """Physical collection name for one build behind alias, e.g. rag_text_chunks_v20261018093000."""
+        return f"{alias}_v{version or time.strftime('%Y%m%d%H%M%S')}"
+
+    def resolve_alias(self, name: str) -> str:
+        """Collection that alias name points to, or name itself if it is not an alias."""
+        for a in self.client.get_aliases().aliases:
+            if a.alias_name == name:
+                return a.collection_name
+        return name
+
+    def collection_versions(self, alias: str) -> List[str]:
+        """Versioned collections built for alias, oldest first."""
+        pattern = re.compile(rf"^{re.escape(alias)}_v\d+$")
+        return sorted(c.name for c in self.client.get_collections().collections if pattern.match(c.name))
+
+    def swap_alias(self, alias: str, collection_name: str) -> Optional[str]:
+        """
+        Point alias at collection_name in one atomic alias update and return the
+        collection it pointed to before (None if new). A plain collection that still
+        uses the alias's name is dropped first, which is the only non-atomic case.
+        """
+        previous = self.resolve_alias(alias)
+        if previous == alias:
+            previous = None
+            if alias in {c.name for c in self.client.get_collections().collections}:
+                self.client.delete_collection(collection_name=alias)
+        ops: List[Any] = []
+        if previous is not None:
+            ops.append(models.DeleteAliasOperation(delete_alias=models.DeleteAlias(alias_name=alias)))
+        ops.append(models.CreateAliasOperation(
+            create_alias=models.CreateAlias(collection_name=collection_name, alias_name=alias)
+        ))
+        self.client.update_collection_aliases(change_aliases_operations=ops)
+        self._alias_map_time = float("-inf") # searches through alias now key on collection_name
+        return previous
+
+    def gc_collection_versions(self, alias: str, keep: int = 1) -> List[str]:
+        """
+        Delete old versions behind alias, keeping the live one plus the `keep` newest
+        others for rollback. Returns the deleted collection names.
+        """
+        live = self.resolve_alias(alias)
+        retired = [c for c in self.collection_versions(alias) if c != live]
+        doomed = retired[:max(0, len(retired) - keep)]
+        for name in doomed:
+            self.client.delete_collection(collection_name=name)
+        return doomed
+
     # ---------- PAYLOAD INDEXES ----------
 
     def create_payload_index(
         self,
         collection_name: str,
         field_name: str,
-        schema: models.PayloadSchemaType = models.PayloadSchemaType.KEYWORD,
+        schema: PayloadFieldSchema = models.PayloadSchemaType.KEYWORD,
+        wait: bool = True,
     ) -> None:
         self.client.create_payload_index(
             collection_name=collection_name,
             field_name=field_name,
             field_schema=schema,
+            wait=wait,
         )
 
-    # ---------- UPSERT / DELETE / FETCH ----------
+    def ensure_payload_indexes(
+        self,
+        collection_name: str,
+        schema: Mapping[str, PayloadFieldSchema],
+        wait: bool = True,
+    ) -> Dict[str, str]:
+        """
+        Create missing indexes and replace ones whose type or parameters differ from
+        schema (see payload_schema.py); indexes of other fields are left alone.
+        Returns {field: "created" | "replaced"} for the fields that changed.
+        """
+        existing = self.collection_info(collection_name).payload_schema or {}
+        changed: Dict[str, str] = {}
+        for field_name, field_schema in schema.items():
+            info = existing.get(field_name)
+            if info is not None and schema_matches(info, field_schema):
+                continue
+            if info is not None:
+                self.client.delete_payload_index(collection_name=collection_name, field_name=field_name, wait=True)
+            self.create_payload_index(collection_name, field_name, field_schema, wait=wait)
+            changed[field_name] = "created" if info is None else "replaced"
+        return changed
 
-    def upsert_points(
+    def check_payload_indexes(self, collection_name: str, schema: Mapping[str, PayloadFieldSchema]) -> List[str]:
+        """Fields whose index in collection_info is missing or differs from schema."""
+        existing = self.collection_info(collection_name).payload_schema or {}
+        return [f for f, fs in schema.items() if f not in existing or not schema_matches(existing[f], fs)]
+
+    # ---------- BULK LOAD ----------
+
+    def begin_bulk_load(self, collection_name: str) -> None:
+        """
+        Stop HNSW indexing (indexing_threshold=0) so upserts only append to plain
+        segments; end_bulk_load() restores the threshold and the index is built once.
+        """
+        info = self.collection_info(collection_name)
+        self._bulk_thresholds[collection_name] = info.config.optimizer_config.indexing_threshold
+        self.client.update_collection(
+            collection_name=collection_name,
+            optimizers_config=models.OptimizersConfigDiff(indexing_threshold=0),
+        )
+
+    def is_bulk_loading(self, collection_name: str) -> bool:
+        """True if indexing is off, e.g. after a bulk load that never finished."""
+        return self.collection_info(collection_name).config.optimizer_config.indexing_threshold == 0
+
+    def end_bulk_load(
         self,
         collection_name: str,
-        ids: Iterable[Union[int, str]],
-        vectors: Iterable[Union[List[float], Dict[str, List[float]]]],
-        payloads: Optional[Iterable[Optional[Dict[str, Any]]]] = None,
-        batch_size: int = 512,
+        *,
+        wait: bool = True,
+        timeout: Optional[float] = None,
+        progress: Optional[Callable[[models.CollectionInfo], None]] = None,
     ) -> None:
+        """Re-enable indexing; with wait=True block until the index is built (see wait_for_green)."""
+        threshold = self._bulk_thresholds.pop(collection_name, None) or DEFAULT_INDEXING_THRESHOLD
+        self.client.update_collection(
+            collection_name=collection_name,
+            optimizers_config=models.OptimizersConfigDiff(indexing_threshold=threshold),
+        )
+        if wait:
+            self.wait_for_green(collection_name, timeout=timeout, progress=progress)
+
+    def wait_for_green(
+        self,
+        collection_name: str,
+        *,
+        timeout: Optional[float] = None,
+        poll_interval: float = 1.0,
+        progress: Optional[Callable[[models.CollectionInfo], None]] = None,
+    ) -> float:
         """
-        Upsert in batches. For named-vectors collections, pass vector as dict
-        e.g. {"image": [...], "caption": [...]}.
+        Poll until all pending writes are applied and the optimizers are idle; returns
+        the seconds waited. progress is called with the CollectionInfo of every poll.
         """
+        t0 = time.perf_counter()
+        triggered = False
+        while True:
+            info = self.collection_info(collection_name)
+            if progress is not None:
+                progress(info)
+            if info.status == models.CollectionStatus.GREEN:
+                return time.perf_counter() - t0
+            if info.status == models.CollectionStatus.RED:
+                raise RuntimeError(f"Optimizers of '{collection_name}' failed: {info.optimizer_status}")
+            if info.status == models.CollectionStatus.GREY and not triggered:
+                # Pending optimizations only start on the next update
+                self.client.update_collection(collection_name=collection_name, optimizers_config=models.OptimizersConfigDiff())
+                triggered = True
+            if timeout is not None and time.perf_counter() - t0 > timeout:
+                raise TimeoutError(f"'{collection_name}' still {info.status.value} after {timeout:.0f}s")
+            time.sleep(poll_interval)
+
+    # ---------- UPSERT / DELETE / FETCH ----------
+
+    @staticmethod
+    def _point_batches(
+        ids: Iterable[PointId],
+        vectors: VectorsLike,
+        payloads: Optional[PayloadsLike],
+        batch_size: int,
+    ) -> Iterator[UpsertBatch]:
+        if _is_array_vectors(vectors):
+            yield from VectorStore._array_batches(ids, vectors, payloads, batch_size)
+            return
+
+        if isinstance(payloads, Mapping):
+            n_rows = len(next(iter(payloads.values()), []))
+            payloads = _payload_rows(payloads, 0, n_rows)
         payl_iter = iter(payloads) if payloads is not None else repeat(None)
-        
+
         # 1. Zip iterables together first
         all_data_iter = zip(ids, vectors, payl_iter)
 
@@ -163,20 +496,100 @@ class VectorStore:
                 break
 
             # 3. Create points from the batch
-            points = [
-                models.PointStruct(id=id, vector=vec, payload=payl)
+            yield [
+                models.PointStruct(id=_to_point_id(id), vector=vec, payload=payl)
                 for id, vec, payl in batch
             ]
-            self.client.upsert(collection_name=collection_name, points=points)
+
+    @staticmethod
+    def _array_batches(
+        ids: Iterable[PointId],
+        vectors: Union[np.ndarray, Mapping[str, np.ndarray]],
+        payloads: Optional[PayloadsLike],
+        batch_size: int,
+    ) -> Iterator[ArrayBatch]:
+        """Slice contiguous float32 arrays into batches without per-point Python objects."""
+        point_ids = [_to_point_id(i) for i in ids]
+        if isinstance(vectors, np.ndarray):
+            arrays: Union[np.ndarray, Dict[str, np.ndarray]] = np.ascontiguousarray(vectors, dtype=np.float32)
+            lengths = {arrays.shape[0]}
+        else:
+            arrays = {
+                k: np.ascontiguousarray(v, dtype=np.float32) if isinstance(v, np.ndarray) else list(v)
+                for k, v in vectors.items()
+            }
+            lengths = {len(a) for a in arrays.values()}
+        if lengths != {len(point_ids)}:
+            raise ValueError(f"Got {len(point_ids)} ids but vector rows {sorted(lengths)}")
+
+        rows_payloads: Optional[List[Optional[Dict[str, Any]]]] = None
+        if payloads is not None and not isinstance(payloads, Mapping):
+            rows_payloads = list(payloads)
+
+        for start in range(0, len(point_ids), batch_size):
+            stop = min(start + batch_size, len(point_ids))
+            if isinstance(arrays, np.ndarray):
+                vecs: Union[np.ndarray, Dict[str, np.ndarray]] = arrays[start:stop]
+            else:
+                vecs = {k: a[start:stop] for k, a in arrays.items()}
+            if rows_payloads is not None:
+                payl = rows_payloads[start:stop]
+            else:
+                payl = _payload_rows(payloads, start, stop)
+            yield ArrayBatch(ids=point_ids[start:stop], vectors=vecs, payloads=payl)
+
+    def upsert_points(
+        self,
+        collection_name: str,
+        ids: Iterable[PointId],
+        vectors: VectorsLike,
+        payloads: Optional[PayloadsLike] = None,
+        batch_size: int = 512,
+        wait: bool = True,
+        max_retries: int = 5,
+    ) -> None:
+        """
+        Upsert in batches. For named-vectors collections, pass vector as dict
+        e.g. {"image": [...], "caption": [...]}.
+        vectors may also be a (N, D) float32 ndarray, or {name: ndarray} for named
+        vectors, and payloads a columnar {field: values} mapping; such batches are
+        sent as models.Batch without building one PointStruct per point. In that
+        mapping, sparse vectors are given as a list of models.SparseVector, and ""
+        names the default dense vector of a collection created with a single
+        (size, distance) spec, e.g. {"": emb, "bm25": sparse}.
+        ids may be ints, UUIDs or arbitrary string keys (e.g. chunk_id), which are
+        mapped to stable UUIDv5s so re-runs overwrite the same points.
+        Transient errors are retried with backoff; see background_upserter() to
+        overlap upserts with embedding.
+        """
+        for batch in self._point_batches(ids, vectors, payloads, batch_size):
+            points = _as_upsert_points(batch)
+            with_retry(
+                lambda: self.client.upsert(collection_name=collection_name, points=points, wait=wait),
+                max_retries=max_retries,
+            )
+            self._touched(collection_name)
+
+    def background_upserter(
+        self,
+        parallelism: int = 2,
+        max_in_flight: int = 4,
+        wait: bool = True,
+        max_retries: int = 5,
+    ) -> "BackgroundUpserter":
+        """Pipelined upserts on worker threads; use as a context manager so it flushes on exit."""
+        return BackgroundUpserter(
+            self, parallelism=parallelism, max_in_flight=max_in_flight, wait=wait, max_retries=max_retries
+        )
 
     def delete_points(
         self,
         collection_name: str,
-        point_ids: Iterable[Union[int, str]],
+        point_ids: Iterable[PointId],
         batch_size: int = 512,
     ) -> None:
         """Deletes points in batches to avoid OOM errors."""
-        ids_iter = iter(point_ids)
+        ids_iter = map(_to_point_id, point_ids)
         while True:
             batch_ids = list(islice(ids_iter, batch_size))
             if not batch_ids:
@@ -184,21 +597,22 @@ class VectorStore:
             
             self.client.delete(
                 collection_name=collection_name, 
-                points=batch_ids,
+                points_selector=models.PointIdsList(points=batch_ids),
                 wait=False # Set to True if you need to guarantee deletion before next step
             )
+            self._touched(collection_name)
 
     def retrieve_points(
         self,
         collection_name: str,
-        point_ids: Iterable[Union[int, str]],
+        point_ids: Iterable[PointId],
         with_payload: bool = True,
         with_vectors: bool = False,
         batch_size: int = 512,
     ) -> List[models.Record]:
         """Retrieves points in batches to avoid OOM errors."""
         all_records = []
-        ids_iter = iter(point_ids)
+        ids_iter = map(_to_point_id, point_ids)
         while True:
             batch_ids = list(islice(ids_iter, batch_size))
             if not batch_ids:
@@ -233,26 +647,236 @@ class VectorStore:
           - vector_name="image", query_vector=[...], or
           - query_vector={"image": [...]}
         """
-        # 1. Determine the query vector object first
-        q_vector: Union[List[float], Dict[str, List[float]], models.NamedVector]
-        if vector_name and isinstance(query_vector, list):
-            q_vector = models.NamedVector(name=vector_name, vector=query_vector)
-        elif isinstance(query_vector, (dict, list)):
-            q_vector = query_vector  # Handles dict and plain list for single-vector
-        else:
+        # 1. Resolve the vector name and the query vector
+        if isinstance(query_vector, dict):
+            if len(query_vector) != 1:
+                raise ValueError("query_vector dict must hold exactly one named vector")
+            vector_name, query_vector = next(iter(query_vector.items()))
+        if not isinstance(query_vector, (list, np.ndarray, models.SparseVector)):
             raise TypeError(f"Unsupported query_vector type: {type(query_vector)}")
 
-        # 2. Make a single, DRY call
-        return self.client.search(
-            collection_name=collection_name,
-            query_vector=q_vector,
+        # 2. Make a single, DRY call (the query API replaces the removed client.search)
+        request = models.QueryRequest(
+            query=_as_query(query_vector),
+            using=vector_name,
             limit=limit,
             filter=filter,
+            params=self._params_for(collection_name, query_vector),
             with_payload=with_payload,
-            with_vectors=with_vectors,
+            with_vector=with_vectors,
             score_threshold=score_threshold,
             offset=offset,
         )
+        return self.query_batch(collection_name, [request])[0]
+
+    def _params_for(self, collection_name: str, query: Any) -> Optional[models.SearchParams]:
+        # Sparse searches don't use HNSW or quantization
+        if isinstance(query, models.SparseVector):
+            return None
+        if collection_name in self.search_params:
+            return self.search_params[collection_name]
+        physical = self._physical(collection_name)
+        if physical not in self._profile_params:
+            profile = profile_of(self.collection_info(physical).config)
+            self._profile_params[physical] = profile.search_params if profile is not None else None
+        return self._profile_params[physical]
+
+    def _fused_request(
+        self,
+        collection_name: str,
+        queries: Mapping[Optional[str], Any],
+        *,
+        limit: int,
+        prefetch_limit: Optional[int],
+        filter: Optional[models.Filter],
+        fusion: models.Fusion,
+        with_payload: bool,
+        with_vectors: bool,
+    ) -> models.QueryRequest:
+        """One QueryRequest prefetching from each {using: query} vector and fusing the lists."""
+        prefetch_limit = prefetch_limit or 4 * limit
+        return models.QueryRequest(
+            prefetch=[
+                models.Prefetch(
+                    query=_as_query(q), using=using, limit=prefetch_limit, filter=filter,
+                    params=self._params_for(collection_name, q),
+                )
+                for using, q in queries.items()
+            ],
+            query=models.FusionQuery(fusion=fusion),
+            limit=limit,
+            with_payload=with_payload,
+            with_vector=with_vectors,
+        )
+
+    def query_batch(self, collection_name: str, requests: List[models.QueryRequest]) -> List[List[models.ScoredPoint]]:
+        """
+        Send many QueryRequests in one query_batch_points round-trip. With a
+        result_cache, only the requests without a cached result are sent.
+        """
+        if not requests:
+            return []
+        cache = self.result_cache
+        keys = [cache.key(self._physical(collection_name), "query", r) for r in requests] if cache is not None else None
+        results: List[Optional[List[models.ScoredPoint]]] = (
+            [cache.get(k) for k in keys] if cache is not None else [None] * len(requests)
+        )
+        todo = [i for i, r in enumerate(results) if r is None]
+        if todo:
+            send = [requests[i] for i in todo]
+            responses = with_retry(
+                lambda: self.client.query_batch_points(collection_name=collection_name, requests=send)
+            )
+            for i, resp in zip(todo, responses):
+                results[i] = resp.points
+                if cache is not None:
+                    cache.put(keys[i], resp.points)
+        # Copies, so callers can't mutate cached lists
+        return [list(r) for r in results]
+
+    def search_batch(
+        self,
+        collection_name: str,
+        queries: Union[np.ndarray, Sequence[Union[List[float], models.SparseVector]]],
+        *,
+        vector_name: Optional[str] = None,   # set for named (or sparse) vectors
+        limit: int = 10,
+        filter: Optional[models.Filter] = None,
+        with_payload: bool = True,
+        with_vectors: bool = False,
+        score_threshold: Optional[float] = None,
+    ) -> List[List[models.ScoredPoint]]:
+        """
+        Nearest-neighbour search for many queries against one vector in a single
+        request; queries may be an (N, D) ndarray. Returns one result list per query.
+        """
+        requests = [
+            models.QueryRequest(
+                query=_as_query(q),
+                using=vector_name,
+                limit=limit,
+                filter=filter,
+                params=self._params_for(collection_name, q),
+                with_payload=with_payload,
+                with_vector=with_vectors,
+                score_threshold=score_threshold,
+            )
+            for q in queries
+        ]
+        return self.query_batch(collection_name, requests)
+
+    def hybrid_search(
+        self,
+        collection_name: str,
+        dense_query: List[float],
+        sparse_query: models.SparseVector,
+        *,
+        dense_using: Optional[str] = None,   # None for the default (unnamed) vector
+        sparse_using: str = "bm25",
+        limit: int = 10,
+        prefetch_limit: Optional[int] = None,
+        filter: Optional[models.Filter] = None,
+        fusion: models.Fusion = models.Fusion.RRF,
+        with_payload: bool = True,
+        with_vectors: bool = False,
+    ) -> List[models.ScoredPoint]:
+        """
+        Dense + sparse retrieval fused server-side in one query: each branch
+        prefetches prefetch_limit candidates (default 4 * limit) under the same
+        filter, and the lists are merged with reciprocal rank fusion (or DBSF).
+        """
+        return self.hybrid_search_batch(
+            collection_name, [(dense_query, sparse_query)],
+            dense_using=dense_using, sparse_using=sparse_using, limit=limit,
+            prefetch_limit=prefetch_limit, filter=filter, fusion=fusion,
+            with_payload=with_payload, with_vectors=with_vectors,
+        )[0]
+
+    def hybrid_search_batch(
+        self,
+        collection_name: str,
+        queries: Sequence[Tuple[List[float], models.SparseVector]],
+        *,
+        dense_using: Optional[str] = None,
+        sparse_using: str = "bm25",
+        limit: int = 10,
+        prefetch_limit: Optional[int] = None,
+        filter: Optional[models.Filter] = None,
+        fusion: models.Fusion = models.Fusion.RRF,
+        with_payload: bool = True,
+        with_vectors: bool = False,
+    ) -> List[List[models.ScoredPoint]]:
+        """hybrid_search for many (dense, sparse) query pairs in one round-trip."""
+        requests = [
+            self._fused_request(
+                collection_name,
+                {dense_using: dense, sparse_using: sparse},
+                limit=limit, prefetch_limit=prefetch_limit, filter=filter, fusion=fusion,
+                with_payload=with_payload, with_vectors=with_vectors,
+            )
+            for dense, sparse in queries
+        ]
+        return self.query_batch(collection_name, requests)
+
+    def multimodal_search(
+        self,
+        collection_name: str,
+        image_query: Optional[List[float]] = None,
+        caption_query: Optional[List[float]] = None,
+        *,
+        image_using: str = "image",
+        caption_using: str = "caption",
+        limit: int = 10,
+        prefetch_limit: Optional[int] = None,
+        filter: Optional[models.Filter] = None,
+        fusion: models.Fusion = models.Fusion.RRF,
+        with_payload: bool = True,
+        with_vectors: bool = False,
+    ) -> List[models.ScoredPoint]:
+        """
+        Search media by its image (CLIP) and caption (MiniLM) vectors at once, fused
+        server-side. image_query is a CLIP image or text embedding; caption_query a
+        text embedding. Either may be omitted to search one vector only.
+        """
+        return self.multimodal_search_batch(
+            collection_name, [(image_query, caption_query)],
+            image_using=image_using, caption_using=caption_using, limit=limit,
+            prefetch_limit=prefetch_limit, filter=filter, fusion=fusion,
+            with_payload=with_payload, with_vectors=with_vectors,
+        )[0]
+
+    def multimodal_search_batch(
+        self,
+        collection_name: str,
+        queries: Sequence[Tuple[Optional[List[float]], Optional[List[float]]]],
+        *,
+        image_using: str = "image",
+        caption_using: str = "caption",
+        limit: int = 10,
+        prefetch_limit: Optional[int] = None,
+        filter: Optional[models.Filter] = None,
+        fusion: models.Fusion = models.Fusion.RRF,
+        with_payload: bool = True,
+        with_vectors: bool = False,
+    ) -> List[List[models.ScoredPoint]]:
+        """multimodal_search for many (image_query, caption_query) pairs in one round-trip."""
+        requests = []
+        for image_q, caption_q in queries:
+            branches = {u: q for u, q in ((image_using, image_q), (caption_using, caption_q)) if q is not None}
+            if not branches:
+                raise ValueError("multimodal search needs an image_query or a caption_query")
+            requests.append(self._fused_request(
+                collection_name,
+                branches,
+                limit=limit, prefetch_limit=prefetch_limit, filter=filter, fusion=fusion,
+                with_payload=with_payload, with_vectors=with_vectors,
+            ))
+        return self.query_batch(collection_name, requests)
+
+    def has_sparse_vector(self, collection_name: str, name: str) -> bool:
+        """Whether an existing collection defines the named sparse vector."""
+        params = self.collection_info(collection_name).config.params
+        return name in (params.sparse_vectors or {})
 
     # ---------- UTILITIES ----------
 
@@ -303,3 +927,108 @@ class VectorStore:
         if got != expected:
             raise ValueError(f"Embedding dim mismatch for '{collection_name}'"
                              f"{'/' + vector_name if vector_name else ''}: expected {expected}, got {got}")
+
+
+class BackgroundUpserter:
+    """
+    Sends upsert batches from a thread pool so the caller (e.g. the encoder loop)
+    can keep working while earlier batches are written and indexed by Qdrant.
+
+    At most max_in_flight batches are queued or running; submitting beyond that
+    blocks, which bounds memory. Failed batches are retried with backoff and the
+    first permanent error is re-raised on the next submit or on flush().
+    """
+
+    def __init__(
+        self,
+        store: VectorStore,
+        parallelism: int = 2,
+        max_in_flight: int = 4,
+        wait: bool = True,
+        max_retries: int = 5,
+    ):
+        self.store = store
+        self.wait = wait
+        self.max_retries = max_retries
+        self._pool = ThreadPoolExecutor(max_workers=max(1, parallelism), thread_name_prefix="qdrant-upsert")
+        self._slots = threading.BoundedSemaphore(max(1, max_in_flight))
+        self._lock = threading.Lock()
+        self._pending: set = set()
+        self._error: Optional[BaseException] = None
+        self.batches_sent = 0
+        self.points_sent = 0
+
+    def _send(self, collection_name: str, batch: UpsertBatch) -> None:
+        points = _as_upsert_points(batch)
+        with_retry(
+            lambda: self.store.client.upsert(collection_name=collection_name, points=points, wait=self.wait),
+            max_retries=self.max_retries,
+        )
+        self.store._touched(collection_name)
+        with self._lock:
+            self.batches_sent += 1
+            self.points_sent += len(batch)
+
+    def _done(self, fut: Future) -> None:
+        self._slots.release()
+        with self._lock:
+            self._pending.discard(fut)
+            if fut.exception() is not None and self._error is None:
+                self._error = fut.exception()
+
+    def _raise_error(self) -> None:
+        with self._lock:
+            err, self._error = self._error, None
+        if err is not None:
+            raise err
+
+    def submit(self, collection_name: str, batch: UpsertBatch) -> None:
+        """Queue one batch of points, blocking while max_in_flight batches are outstanding."""
+        self._raise_error()
+        self._slots.acquire()
+        fut = self._pool.submit(self._send, collection_name, batch)
+        with self._lock:
+            self._pending.add(fut)
+        fut.add_done_callback(self._done)
+
+    def upsert_points(
+        self,
+        collection_name: str,
+        ids: Iterable[PointId],
+        vectors: VectorsLike,
+        payloads: Optional[PayloadsLike] = None,
+        batch_size: int = 512,
+    ) -> None:
+        """Same arguments as VectorStore.upsert_points, but returns once batches are queued."""
+        for batch in self.store._point_batches(ids, vectors, payloads, batch_size):
+            self.submit(collection_name, batch)
+
+    def flush(self) -> None:
+        """Barrier: block until every queued batch is written, then raise the first error, if any."""
+        while True:
+            with self._lock:
+                pending = list(self._pending)
+            if not pending:
+                break
+            for fut in pending:
+                try:
+                    fut.result()
+                except Exception:
+                    pass # Surfaced via _raise_error below
+        self._raise_error()
+
+    def close(self) -> None:
+        try:
+            self.flush()
+        finally:
+            self._pool.shutdown(wait=True)
+
+    def __enter__(self) -> "BackgroundUpserter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            # Don't mask the original error with a flush failure
+            self._pool.shutdown(wait=True)
+            return
+        self.close()